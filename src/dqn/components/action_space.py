@@ -0,0 +1,89 @@
+import numpy as np
+import torch
+
+ACTION_RANGE = [-3, 3]
+
+
+def get_actions(nb_actions, type_actions, action_range=ACTION_RANGE):
+    if type_actions == 'linear':
+        return np.linspace(action_range[0], action_range[1], num=nb_actions)
+    else:
+        negative_num = nb_actions//2
+        positive_num = nb_actions - negative_num
+        positive_space = np.logspace(0, 1, num=positive_num, dtype=float, base=action_range[1] + 1) - 1
+        negative_space = -np.logspace(0, 1, num=negative_num + 1, dtype=float, base=-action_range[0] + 1)[1:] + 1
+        return np.sort(np.concatenate((positive_space, negative_space)))
+
+
+def quantile_actions(samples, nb_actions, action_range=ACTION_RANGE):
+    """Adaptive discretization, one action per quantile of a sample of continuous actions
+
+    The bins are dense where the sampled policy acts most, e.g. actions recorded from a PPO agent.
+    """
+    samples = np.clip(np.asarray(samples, dtype=np.float64).reshape(-1), action_range[0], action_range[1])
+    quantiles = (np.arange(nb_actions) + 0.5) / nb_actions
+    return np.quantile(samples, quantiles)
+
+
+class ActionSpace:
+    def __init__(self, values, device="cpu") -> None:
+        """Discrete action set, kept once on the host for the environments and once on device for the models
+
+        Args:
+            values (np.ndarray): Sorted action values
+            device (str, optional): Device of the models. Defaults to "cpu".
+        """
+        self._values = np.asarray(values, dtype=np.float64)
+        self._table = torch.as_tensor(self._values, dtype=torch.float32).to(device)
+        # Decision boundaries between consecutive actions, for nearest action lookups
+        self._midpoints = (self._values[1:] + self._values[:-1]) / 2
+        self._device_midpoints = torch.as_tensor(self._midpoints, dtype=torch.float32).to(device)
+
+    @classmethod
+    def make(cls, nb_actions, type_actions="log", action_range=ACTION_RANGE, samples=None, device="cpu"):
+        """Action space of type "linear", "log" or "quantile", the latter fitted to samples"""
+        if type_actions == "quantile":
+            assert samples is not None, "quantile actions need a sample of continuous actions"
+            return cls(quantile_actions(samples, nb_actions, action_range), device=device)
+        return cls(get_actions(nb_actions, type_actions, action_range), device=device)
+
+    @property
+    def values(self):
+        return self._values
+
+    @property
+    def table(self):
+        return self._table
+
+    def __len__(self):
+        return len(self._values)
+
+    def __getitem__(self, index):
+        """Host actions of the indexes, for the environments"""
+        if isinstance(index, torch.Tensor):
+            index = index.cpu().numpy()
+        return self._values[index]
+
+    def to_actions(self, indexes):
+        """Actions of a batch of indexes, on device for tensors and on the host for arrays"""
+        if isinstance(indexes, torch.Tensor):
+            return self._table[indexes.to(self._table.device)]
+        return self._values[indexes]
+
+    def to_indexes(self, actions):
+        """Index of the nearest action of every continuous action"""
+        if isinstance(actions, torch.Tensor):
+            if hasattr(torch, "bucketize"):
+                return torch.bucketize(actions, self._device_midpoints)
+            return torch.sum(actions.unsqueeze(dim=-1) > self._device_midpoints, dim=-1)
+        return np.searchsorted(self._midpoints, actions, side="left")
+
+    def moments(self, probs: torch.Tensor):
+        """Expectation and variance of the actions under probs, of shape (batch, actions)
+
+        Returns:
+            tuple: (batch,) expectations and variances
+        """
+        expectation = probs @ self._table
+        variance = torch.sum(probs * (self._table - expectation.unsqueeze(dim=-1)) ** 2, dim=-1)
+        return expectation, variance
@@ -1,8 +1,12 @@
 import numpy as np
-import matplotlib.pyplot as plt
 
 class Epsilon:
     def __init__(self, max_steps, method='linear', epsilon_max=1.0, epsilon_min=0.1, factor=3):
+        """Epsilon decay schedule, precomputed as a float32 table over [0, max_steps]
+
+        Steps past max_steps are computed with the schedule formula. Every method accepts
+        a step or an array of steps, e.g. one per environment.
+        """
         method = method.lower()
         if method == "constant":
             self._get_epsilon = self.constant
@@ -23,15 +27,28 @@ class Epsilon:
         self._factor = factor
 
         self._step = 0
+        self._table = self._get_epsilon(np.arange(max_steps + 1)).astype(np.float32)
+        # Python floats for the scalar lookups done every environment step
+        self._values = self._table.tolist()
 
     def __call__(self, step):
-        return self._get_epsilon(max(0, step))
+        if isinstance(step, (int, np.integer)):
+            step = max(0, int(step))
+            return self._values[step] if step < len(self._values) else float(self._get_epsilon(step))
+        steps = np.maximum(0, np.asarray(step, dtype=np.int64))
+        if steps.ndim == 0:
+            return float(self._table[steps]) if steps < len(self._table) else float(self._get_epsilon(steps))
+        epsilons = self._table[np.minimum(steps, len(self._table) - 1)]
+        beyond = steps >= len(self._table)
+        if beyond.any():
+            epsilons[beyond] = self._get_epsilon(steps[beyond])
+        return epsilons
     
     def constant(self, step):
-        return self._epsilon_max
+        return np.full(np.shape(step), self._epsilon_max)
 
     def linear(self, step):
-        return max(
+        return np.maximum(
             self._epsilon_min,
             self._epsilon_max
             - (self._epsilon_max - self._epsilon_min) * step / self._max_steps,
@@ -47,13 +64,22 @@ class Epsilon:
     
     def step(self):
         self._step += 1
-        return self._get_epsilon(self._step)
+        return self(self._step)
     
-    def epsilon(self):
-        return self._get_epsilon(self._step)
+    def epsilon(self, steps=None):
+        """Epsilon at the current step, or at every step of steps"""
+        return self(self._step if steps is None else steps)
+
+    def state_dict(self):
+        return {"step": self._step}
+
+    def load_state_dict(self, state_dict):
+        self._step = state_dict["step"]
 
     def plot_epsilon(self, steps):
-        plt.plot([self(x) for x in range(steps)])
+        import matplotlib.pyplot as plt
+
+        plt.plot(self(np.arange(steps)))
         plt.xlabel("Steps")
         plt.ylabel("Epsilon")
         plt.savefig("fig.png")
@@ -0,0 +1,55 @@
+import copy
+import torch
+import torch.nn as nn
+
+
+def inference_mode():
+    """torch.inference_mode where available, no_grad on older torch"""
+    return torch.inference_mode() if hasattr(torch, "inference_mode") else torch.no_grad()
+
+
+class TargetNetwork:
+    def __init__(self, model: nn.Module, tau: float = None, update_every: int = 1) -> None:
+        """Frozen copy of a network used to compute TD targets
+
+        Args:
+            model (nn.Module): Online network
+            tau (float, optional): Polyak averaging factor applied after every update,
+                if None the copy is replaced every update_every updates. Defaults to None.
+            update_every (int, optional): Updates between hard copies. Defaults to 1.
+        """
+        self.model = copy.deepcopy(model)
+        for param in self.model.parameters():
+            param.requires_grad_(False)
+        self._online = list(model.parameters())
+        self._target = list(self.model.parameters())
+        self._tau = tau
+        self._update_every = max(1, update_every)
+
+    def __call__(self, *args, **kwargs):
+        return self.model(*args, **kwargs)
+
+    def reset(self):
+        """Copy the online weights"""
+        with torch.no_grad():
+            for target, online in zip(self._target, self._online):
+                target.copy_(online)
+
+    def update(self, nb_update):
+        """Follow the online network once it has done nb_update updates"""
+        if self._tau is None:
+            if nb_update % self._update_every == 0:
+                self.reset()
+            return
+        with torch.no_grad():
+            if hasattr(torch, "_foreach_lerp_"):
+                torch._foreach_lerp_(self._target, self._online, self._tau)
+            else:
+                for target, online in zip(self._target, self._online):
+                    target.lerp_(online, self._tau)
+
+    def state_dict(self):
+        return self.model.state_dict()
+
+    def load_state_dict(self, state_dict):
+        self.model.load_state_dict(state_dict)
@@ -1,7 +1,10 @@
+import os
+import pickle
 import numpy as np
 from tqdm import tqdm
 
-from shared.utils.utils import save_uncert
+from shared.utils.utils import save_uncert, get_rng_state, set_rng_state
+from shared.components.checkpointer import get_checkpointer
 from shared.components.evaluator import Evaluator
 from shared.components.env import Env
 from shared.components.logger import Logger
@@ -22,6 +25,8 @@ class Trainer:
         checkpoint_every=10,
         debug=False,
         evaluator: Evaluator = None,
+        nb_updates: int = 1,
+        update_every: int = 1,
     ) -> None:
         self._logger = logger
         self._agent = agent
@@ -35,22 +40,25 @@ class Trainer:
         self._checkpoint_every = checkpoint_every
         self._debug = debug
         self._evaluator = evaluator
+        # Replay ratio: nb_updates minibatches every update_every environment steps
+        self._nb_updates = nb_updates
+        self._update_every = update_every
 
         self.best_model_path = f"param/best_{model_name}.pkl"
         self.checkpoint_model_path = f"param/checkpoint_{self._model_name}.pkl"
+        self._checkpoint_base_path = f"param/checkpoint_{self._model_name}"
 
         self._best_score = -100
         self._eval_nb = 0
         self._max_running_score = 0
         self._global_step = 0
+        self._running_score = 0
 
     def run(self):
-        running_score = 0
-
         for i_ep in tqdm(range(self._init_ep, self._nb_episodes), 'Training'):
             metrics = {
                 "Train Episode": i_ep,
-                "Episode Running Score": float(running_score),
+                "Episode Running Score": float(self._running_score),
                 "Episode Score": 0,
                 "Episode Steps": 0,
             }
@@ -62,8 +70,8 @@ class Trainer:
                 next_state, reward, done, die, info = self._env.step(action)
                 if self._agent.store_transition(
                     state, action_idx, next_state, reward, (done or die)
-                ):
-                    self._agent.update()
+                ) and (self._global_step + 1) % self._update_every == 0:
+                    self._agent.update(self._nb_updates)
                 metrics["Episode Score"] += reward
                 metrics["Episode Steps"] += 1
                 rewards.append(reward)
@@ -71,10 +79,11 @@ class Trainer:
                 self._global_step += 1
                 if done or die:
                     break
-            running_score = running_score * 0.99 + metrics["Episode Score"] * 0.01
-            if running_score > self._max_running_score:
-                self._max_running_score = running_score
-            metrics["Episode Running Score"] = running_score
+            self._agent.end_episode()
+            self._running_score = self._running_score * 0.99 + metrics["Episode Score"] * 0.01
+            if self._running_score > self._max_running_score:
+                self._max_running_score = self._running_score
+            metrics["Episode Running Score"] = self._running_score
             metrics["Max Episode Running Score"] = self._max_running_score
             metrics["Epsilon"] = self._agent.get_epsilon()
             # metrics["Episode Min Reward"] = float(np.min(rewards))
@@ -94,18 +103,59 @@ class Trainer:
                     self._best_score = eval_score
             # Save checkpoint
             if (i_ep + 1) % self._checkpoint_every == 0 and not self._debug:
-                self._agent.save(i_ep, path=self.checkpoint_model_path)
+                self.save_checkpoint(i_ep)
             # Stop training
-            if running_score > self._env.reward_threshold:
+            if self._running_score > self._env.reward_threshold:
                 print(
                     "Solved! Running reward is now {} and the last episode runs to {}!".format(
-                        running_score, metrics["Episode Score"]
+                        self._running_score, metrics["Episode Score"]
                     )
                 )
                 if not self._debug:
                     self._agent.save(i_ep, path=self.best_model_path)
                 break
 
+    def save_checkpoint(self, i_ep):
+        """Save the agent with everything needed to resume training after episode i_ep"""
+        self._agent.save(i_ep, path=self.checkpoint_model_path)
+        state = {
+            "episode": i_ep + 1,
+            "running_score": self._running_score,
+            "max_running_score": self._max_running_score,
+            "best_score": self._best_score,
+            "eval_nb": self._eval_nb,
+            "global_step": self._global_step,
+            "rng": get_rng_state(),
+            "env_rng": self._env.get_rng_state() if self._env is not None else None,
+            "agent": self._agent.get_training_state(f"{self._checkpoint_base_path}_buffer"),
+        }
+        get_checkpointer().save(state, f"{self._checkpoint_base_path}_state.pkl", dump=pickle.dump)
+
+    def load_training_state(self, checkpoint_path):
+        """Resume from the training state saved along checkpoint_path, if any
+
+        The agent must already be loaded from checkpoint_path and init_ep set to its epoch.
+        """
+        get_checkpointer().flush()
+        base_path = os.path.splitext(checkpoint_path)[0]
+        if not os.path.exists(f"{base_path}_state.pkl"):
+            return
+        with open(f"{base_path}_state.pkl", "rb") as f:
+            state = pickle.load(f)
+        if state["episode"] != self._init_ep + 1:
+            print(f"Training state of {checkpoint_path} does not match its model, ignoring it")
+            return
+        self._init_ep = state["episode"]
+        self._running_score = state["running_score"]
+        self._max_running_score = state["max_running_score"]
+        self._best_score = state["best_score"]
+        self._eval_nb = state["eval_nb"]
+        self._global_step = state["global_step"]
+        self._agent.load_training_state(state["agent"], f"{base_path}_buffer")
+        set_rng_state(state["rng"])
+        if self._env is not None and state["env_rng"] is not None:
+            self._env.set_rng_state(state["env_rng"])
+
     def eval(self, episode_nb, mode='eval'):
         assert mode in ['train', 'eval', 'test0', 'test']
         if self._evaluator:
@@ -145,7 +195,7 @@ class Trainer:
                     i_val,
                     score,
                     uncert,
-                    file=f"uncertainties/{mode}/{self._model_name}.txt",
+                    file=f"uncertainties/{mode}/{self._model_name}.trace",
                     sigma=self._eval_env.random_noise,
                 )
 
@@ -0,0 +1,41 @@
+import torch
+
+from .base_agent import BaseAgent
+from shared.utils.losses import det_loss
+from dqn.components.target_network import inference_mode
+
+class AleatoricAgent(BaseAgent):
+    def __init__(self, **kwargs):
+        super(AleatoricAgent, self).__init__(**kwargs)
+        self._criterion = det_loss
+        self._weight_decay = 1e-10
+
+    def chose_action(self, state: torch.Tensor):
+        _, mu, _ = self._model1(state)
+        _, index = torch.max(mu, dim=-1)
+        return index
+
+    def get_uncert_batch(self, states: torch.Tensor):
+        _, mu, log_var = self._model1(states)
+        _, index = torch.max(mu, dim=-1)
+
+        aleatoric = log_var.gather(1, index.unsqueeze(dim=-1)).squeeze(dim=-1)
+        epistemic = torch.zeros_like(aleatoric)
+        return index, (epistemic, aleatoric)
+
+    def compute_loss(self, states, actions, next_states, rewards, discounts):
+        v1, mu1, log_var1 = [output.gather(1, actions).squeeze(dim=-1) for output in self._model1(states)]
+        v2, mu2, log_var2 = [output.gather(1, actions).squeeze(dim=-1) for output in self._model2(states)]
+
+        with inference_mode():
+            target1, target2 = self.target_models()
+            next_Q = torch.min(
+                torch.max(target1(next_states)[1], 1)[0],
+                torch.max(target2(next_states)[1], 1)[0],
+            )
+        expected_Q = rewards + discounts * next_Q
+
+        loss1 = self._criterion(v1, expected_Q, mu1, log_var1, weight_decay=self._weight_decay)
+        loss2 = self._criterion(v2, expected_Q, mu2, log_var2, weight_decay=self._weight_decay)
+
+        return loss1, loss2
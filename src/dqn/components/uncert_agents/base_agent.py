@@ -7,8 +7,12 @@ import torch
 import numpy as np
 
 from shared.utils.replay_buffer import ReplayMemory
+from shared.utils.arena import ParameterArena
 from shared.components.logger import Logger
+from shared.components.checkpointer import get_checkpointer
 from dqn.components.eps_scheduler import Epsilon
+from dqn.components.action_space import ActionSpace
+from dqn.components.target_network import TargetNetwork, inference_mode
 
 class BaseAgent:
     def __init__(
@@ -18,17 +22,19 @@ class BaseAgent:
         gamma,
         buffer: ReplayMemory,
         logger: Logger,
-        actions: "list",
+        actions: ActionSpace,
         epsilon: Epsilon,
         device="cpu",
         lr=1e-3,
         nb_nets=None,
         clip_grad: bool=False,
+        target_update: int=0,
+        tau: float=None,
         **kwargs,
     ):
         self._logger = logger
         self._device = device
-        self._actions = actions
+        self._actions = actions if isinstance(actions, ActionSpace) else ActionSpace(actions, device=device)
         self._epsilon = epsilon
         self._gamma = gamma
         self.nb_nets = nb_nets
@@ -42,13 +48,40 @@ class BaseAgent:
 
         self.lr = lr
         if self._model1 is not list or self._model1 is not dict:
-            self._optimizer1 = optim.Adam(self._model1.parameters(), lr=lr)
-            self._optimizer2 = optim.Adam(self._model2.parameters(), lr=lr)
+            self._init_optimizers(lr)
+        # Without target networks the TD targets bootstrap from the online models
+        self._targets = self._init_targets(tau, target_update) if tau or target_update else None
         self._nb_update = 0
         self.training_step = 0
+        self._checkpointer = get_checkpointer()
 
         logger.watch(self._model1)
     
+    def _init_optimizers(self, lr):
+        # Adam is elementwise, one optimizer over the packed weights steps both networks as two would
+        self._arena = ParameterArena([self._model1, self._model2])
+        self._optimizer = optim.Adam([self._arena.param], lr=lr)
+
+    def _init_targets(self, tau, target_update):
+        return [TargetNetwork(model, tau=tau, update_every=target_update) for model in (self._model1, self._model2)]
+
+    def target_models(self):
+        """Networks the TD targets bootstrap from"""
+        return self._targets if self._targets else (self._model1, self._model2)
+
+    def update_targets(self):
+        for target in self._targets if self._targets else []:
+            target.update(self._nb_update)
+
+    def _optimizers_state_dict(self):
+        return {"arena_optimizer_state_dict": self._optimizer.state_dict()}
+
+    def _load_optimizers(self, checkpoint):
+        # Checkpoints of the fused agent or with one optimizer per model hold other
+        # parameter layouts, the models restart the optimizer
+        if "arena_optimizer_state_dict" in checkpoint:
+            self._optimizer.load_state_dict(checkpoint["arena_optimizer_state_dict"])
+
     def get_epsilon(self):
         return self._epsilon.epsilon()
 
@@ -56,20 +89,40 @@ class BaseAgent:
         return self._epsilon.step()
     
     def select_action(self, state: np.ndarray, eval=False):
-        aleatoric = torch.Tensor([0])
-        epistemic = torch.Tensor([0])
-        if eval or np.random.rand() > self._epsilon.epsilon():
-            # Select action greedily
+        actions, indexes, (epistemic, aleatoric) = self.select_actions(np.asarray(state)[None], eval=eval)
+        return actions, indexes, (epistemic[0], aleatoric[0])
+
+    def select_actions(self, states: np.ndarray, epsilons=None, eval=False):
+        """Select the actions of a batch of environments
+
+        Args:
+            states (np.ndarray): (N, ...) states
+            epsilons (float or np.ndarray, optional): Epsilon of every environment.
+                Defaults to the current epsilon.
+            eval (bool, optional): Act greedily. Defaults to False.
+
+        Returns:
+            tuple: (N,) actions, (N,) action indexes and (N,) epistemic and aleatoric
+                uncertainties, 0 for random actions
+        """
+        nb_states = states.shape[0]
+        if epsilons is None:
+            epsilons = self._epsilon.epsilon()
+        greedy = np.ones(nb_states, dtype=bool) if eval else np.random.rand(nb_states) > epsilons
+        indexes = torch.from_numpy(np.random.randint(0, len(self._actions), size=nb_states))
+        epistemic = torch.zeros(nb_states)
+        aleatoric = torch.zeros(nb_states)
+        if greedy.any():
+            # Only the greedy rows go through the model
+            rows = torch.from_numpy(np.flatnonzero(greedy))
             with torch.no_grad():
-                index, (epistemic, aleatoric) = self.get_uncert(
-                    (torch.from_numpy(state).unsqueeze(dim=0).float()).to(
-                        self._device
-                    )
+                index, (epis, aleat) = self.get_uncert_batch(
+                    torch.from_numpy(np.asarray(states[greedy], dtype=np.float32)).to(self._device)
                 )
-        else:
-            # Select random action
-            index = torch.randint(0, len(self._actions), size=(1,))
-        return self._actions[index], index.cpu(), (epistemic, aleatoric)
+            indexes[rows] = index.cpu()
+            epistemic[rows] = epis.cpu().float()
+            aleatoric[rows] = aleat.cpu().float()
+        return self._actions[indexes], indexes, (epistemic, aleatoric)
 
     def chose_action(self, state: torch.Tensor):
         values = self._model1(state)
@@ -77,18 +130,23 @@ class BaseAgent:
         return index
 
     def get_uncert(self, state: torch.Tensor):
-        values = self._model1(state)
+        index, (epistemic, aleatoric) = self.get_uncert_batch(state)
+        return index, (torch.mean(epistemic), torch.mean(aleatoric))
+
+    def get_uncert_batch(self, states: torch.Tensor):
+        """Greedy action index and uncertainties of every state, from a single forward"""
+        values = self._model1(states)
         _, index = torch.max(values, dim=-1)
 
         probs = F.softmax(values, dim=1)
-        actions = torch.Tensor(self._actions).to(self._device)
-        expectation = probs @ actions
-        variance = probs @ (actions - expectation) ** 2
-        epistemic = torch.sum(variance)
+        _, epistemic = self._actions.moments(probs)
 
-        aleatoric = torch.Tensor([0])
+        aleatoric = torch.zeros_like(epistemic)
         return index, (epistemic, aleatoric)
 
+    def end_episode(self):
+        self._buffer.end_episode()
+
     def store_transition(self, state, action_idx, next_state, reward, done):
         self._buffer.push(
             torch.from_numpy(np.array(state, dtype=np.float32)).unsqueeze(dim=0),
@@ -104,17 +162,38 @@ class BaseAgent:
             "epoch": epoch,
             "model1_state_disct": self._model1.state_dict(),
             "model2_state_disct": self._model2.state_dict(),
-            "optimizer1_state_dict": self._optimizer1.state_dict(),
-            "optimizer2_state_dict": self._optimizer2.state_dict(),
+            **self._optimizers_state_dict(),
         }
-        torch.save(tosave, path)
+        if self._targets:
+            tosave["target_state_dicts"] = [target.state_dict() for target in self._targets]
+        self._checkpointer.save(tosave, path, key=(epoch, self._nb_update), owner=self)
+
+    def get_training_state(self, path):
+        """Training progress not held by model checkpoints, the buffer is saved in the folder path"""
+        return {
+            "training_step": self.training_step,
+            "nb_update": self._nb_update,
+            "epsilon": self._epsilon.state_dict(),
+            "buffer": self._buffer.save(path, self._checkpointer),
+        }
+
+    def load_training_state(self, state, path):
+        self.training_step = state["training_step"]
+        self._nb_update = state["nb_update"]
+        self._epsilon.load_state_dict(state["epsilon"])
+        self._buffer.load(path, state["buffer"])
 
     def load(self, path, eval_mode=False):
+        self._checkpointer.flush()
         checkpoint = torch.load(path)
         self._model1.load_state_dict(checkpoint["model1_state_disct"])
         self._model2.load_state_dict(checkpoint["model2_state_disct"])
-        self._optimizer1.load_state_dict(checkpoint["optimizer1_state_dict"])
-        self._optimizer2.load_state_dict(checkpoint["optimizer2_state_dict"])
+        self._load_optimizers(checkpoint)
+        for idx, target in enumerate(self._targets if self._targets else []):
+            if "target_state_dicts" in checkpoint:
+                target.load_state_dict(checkpoint["target_state_dicts"][idx])
+            else:
+                target.reset()
 
         if eval_mode:
             self._model1.eval()
@@ -124,34 +203,37 @@ class BaseAgent:
             self._model2.train()
         return checkpoint["epoch"]
 
-    def sample_buffer(self):
-        dataset = self._buffer.sample()
+    def sample_buffer(self, nb_batches=1):
+        """Sample nb_batches minibatches at once, every tensor has a leading nb_batches dimension"""
+        return self.unpack_batches(self._buffer.sample_batches(nb_batches))
 
-        states = torch.cat(dataset.state).float().to(self._device)
-        action_idx = torch.cat(dataset.action).type(torch.int64).to(self._device)
-        next_states = torch.cat(dataset.next_state).float().to(self._device)
-        rewards = torch.cat(dataset.reward).to(self._device)
-        dones = torch.cat(dataset.done).to(self._device)
+    def unpack_batches(self, dataset):
+        states = dataset.state.float().to(self._device)
+        action_idx = dataset.action.type(torch.int64).to(self._device)
+        next_states = dataset.next_state.float().to(self._device)
+        rewards = dataset.reward.float().to(self._device)
+        dones = dataset.done.float().to(self._device)
+        # Discount of the bootstrap, gamma ** n for n-step transitions and 0 at the end of episodes
+        discounts = dataset.discount.float().to(self._device) if "discount" in dataset._fields else self._gamma
+        discounts = (1 - dones) * discounts
 
-        return states, action_idx, next_states, rewards, dones
+        return states, action_idx, next_states, rewards, discounts
 
-    def update(self):
-        states, actions, next_states, rewards, dones = self.sample_buffer()
-        loss1, loss2 = self.compute_loss(states, actions, next_states, rewards, dones)
+    def update(self, nb_updates=1):
+        """Perform nb_updates gradient steps on minibatches sampled together"""
+        for batch in zip(*self.sample_buffer(nb_updates)):
+            self.update_batch(*batch)
+            self.update_targets()
 
-        self._optimizer1.zero_grad()
-        loss1.backward()
-        if self._clip_grad:
-            for param in self._model1.parameters():
-                param.grad.data.clamp_(-1, 1)
-        self._optimizer1.step()
+    def update_batch(self, *batch):
+        loss1, loss2 = self.compute_loss(*batch)
 
-        self._optimizer2.zero_grad()
-        loss2.backward()
+        # The losses do not share parameters, one backward fills the gradients of both models
+        self._arena.zero_grad()
+        (loss1 + loss2).backward()
         if self._clip_grad:
-            for param in self._model2.parameters():
-                param.grad.data.clamp_(-1, 1)
-        self._optimizer2.step()
+            self._arena.clamp_grad_(-1, 1)
+        self._optimizer.step()
 
         losses = {
             "Loss 1": loss1.item(),
@@ -161,17 +243,19 @@ class BaseAgent:
         self._logger.log(losses)
         self._nb_update += 1
 
-    def compute_loss(self, states, actions, next_states, rewards, dones):
+    def compute_loss(self, states, actions, next_states, rewards, discounts):
         curr_Q1 = self._model1(states).gather(1, actions).squeeze(dim=-1)
         curr_Q2 = self._model2(states).gather(1, actions).squeeze(dim=-1)
 
-        next_Q = torch.min(
-            torch.max(self._model1(next_states), 1)[0],
-            torch.max(self._model2(next_states), 1)[0],
-        ).squeeze(dim=-1)
-        expected_Q = rewards + (1 - dones) * self._gamma * next_Q
+        with inference_mode():
+            target1, target2 = self.target_models()
+            next_Q = torch.min(
+                torch.max(target1(next_states), 1)[0],
+                torch.max(target2(next_states), 1)[0],
+            ).squeeze(dim=-1)
+        expected_Q = rewards + discounts * next_Q
 
-        loss1 = self._criterion(curr_Q1, expected_Q.detach())
-        loss2 = self._criterion(curr_Q2, expected_Q.detach())
+        loss1 = self._criterion(curr_Q1, expected_Q)
+        loss2 = self._criterion(curr_Q2, expected_Q)
 
         return loss1, loss2
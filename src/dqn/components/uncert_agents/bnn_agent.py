@@ -0,0 +1,21 @@
+import torch
+import torchbnn as bnn
+
+from .sampling_agent import SamplingAgent
+
+class BNNAgent(SamplingAgent):
+    def __init__(self, **kwargs):
+        super(BNNAgent, self).__init__(**kwargs)
+
+        self._kl_loss = bnn.BKLLoss(reduction='mean', last_layer_only=False)
+        self.complexity_cost_weight = 1e-6
+
+    def forward(self, model, state: torch.Tensor):
+        # Without per-row weights every copy of the tiled batch would share one sample
+        return model(state, per_sample=True)
+
+    def compute_loss(self, *batch):
+        loss1, loss2 = super(BNNAgent, self).compute_loss(*batch)
+        loss1 = loss1 + self._kl_loss(self._model1) * self.complexity_cost_weight
+        loss2 = loss2 + self._kl_loss(self._model2) * self.complexity_cost_weight
+        return loss1, loss2
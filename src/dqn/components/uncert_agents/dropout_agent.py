@@ -0,0 +1,11 @@
+import torch.nn as nn
+
+from .sampling_agent import SamplingAgent
+
+class DropoutAgent(SamplingAgent):
+    def __init__(self, **kwargs):
+        """MC dropout, the dropout masks of the tiled batch give nb_nets passes"""
+        super(DropoutAgent, self).__init__(**kwargs)
+        assert any(
+            isinstance(module, nn.Dropout) and module.p > 0 for module in self._model1.modules()
+        ), "MC dropout needs a model with dropout, the epistemic uncertainty would always be 0"
\ No newline at end of file
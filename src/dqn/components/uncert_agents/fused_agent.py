@@ -0,0 +1,58 @@
+import torch
+import torch.nn as nn
+import torch.optim as optim
+
+from shared.utils.arena import ParameterArena
+from dqn.models.ensemble import EnsembleModel, EnsembleMember
+from dqn.components.target_network import TargetNetwork, inference_mode
+from .base_agent import BaseAgent
+
+
+class FusedAgent(BaseAgent):
+    def __init__(self, model1: nn.Module, model2: nn.Module, **kwargs):
+        """Double DQN agent whose two Q-networks are stacked into one ensemble
+
+        States and next states go through both networks in a single batched forward,
+        and the two losses share one backward and one optimizer step. Checkpoints keep
+        the model1/model2 format of BaseAgent.
+        """
+        self._ensemble = EnsembleModel([model1, model2])
+        super(FusedAgent, self).__init__(
+            EnsembleMember(self._ensemble, 0), EnsembleMember(self._ensemble, 1), **kwargs
+        )
+
+    def _init_optimizers(self, lr):
+        # Adam is elementwise, one optimizer over the stacked weights steps both networks as two would
+        self._arena = ParameterArena([self._ensemble])
+        self._optimizer = optim.Adam([self._arena.param], lr=lr)
+
+    def _init_targets(self, tau, target_update):
+        return [TargetNetwork(self._ensemble, tau=tau, update_every=target_update)]
+
+    def _optimizers_state_dict(self):
+        return {"fused_optimizer_state_dict": self._optimizer.state_dict()}
+
+    def _load_optimizers(self, checkpoint):
+        # The stacked layout differs from BaseAgent's arena, other checkpoints restart the optimizer
+        if "fused_optimizer_state_dict" in checkpoint:
+            self._optimizer.load_state_dict(checkpoint["fused_optimizer_state_dict"])
+
+    def compute_loss(self, states, actions, next_states, rewards, discounts):
+        batch_size = states.shape[0]
+        if self._targets:
+            values = self._ensemble(states)
+            with inference_mode():
+                next_values = self._targets[0](next_states)
+        else:
+            # (2, 2 * batch, actions): both networks on states then next states
+            values = self._ensemble(torch.cat((states, next_states)))
+            values, next_values = values[:, :batch_size], values[:, batch_size:]
+
+        curr_Q = values.gather(2, actions.unsqueeze(dim=0).expand(2, -1, -1)).squeeze(dim=-1)
+        next_Q = torch.min(torch.max(next_values, 2)[0], 0)[0]
+        expected_Q = (rewards + discounts * next_Q).detach()
+
+        loss1 = self._criterion(curr_Q[0], expected_Q)
+        loss2 = self._criterion(curr_Q[1], expected_Q)
+
+        return loss1, loss2
@@ -0,0 +1,68 @@
+import torch
+import numpy as np
+
+from .base_agent import BaseAgent
+from dqn.components.target_network import inference_mode
+
+class MultiHeadAgent(BaseAgent):
+    def __init__(self, mask_prob=0.5, **kwargs):
+        """Bootstrapped DQN, the models share a trunk between nb_nets Q heads
+
+        Every transition is stored with a Bernoulli(mask_prob) mask telling which
+        heads train on it. Heads are evaluated together and the epistemic
+        uncertainty is their disagreement on the selected action.
+        """
+        super(MultiHeadAgent, self).__init__(**kwargs)
+        self._mask_prob = mask_prob
+
+    def chose_action(self, state: torch.Tensor):
+        values = self._model1(state).mean(dim=1)
+        _, index = torch.max(values, dim=-1)
+        return index
+
+    def get_uncert_batch(self, states: torch.Tensor):
+        values = self._model1(states)
+        _, index = torch.max(values.mean(dim=1), dim=-1)
+
+        # Q value of the selected action for every head
+        heads = values.gather(2, index.view(-1, 1, 1).expand(-1, values.shape[1], 1))
+        epistemic = torch.std(heads, dim=1).squeeze(dim=-1)
+
+        aleatoric = torch.zeros_like(epistemic)
+        return index, (epistemic, aleatoric)
+
+    def store_transition(self, state, action_idx, next_state, reward, done):
+        mask = torch.from_numpy(np.random.rand(1, self.nb_nets) < self._mask_prob)
+        self._buffer.push(
+            torch.from_numpy(np.array(state, dtype=np.float32)).unsqueeze(dim=0),
+            action_idx.unsqueeze(dim=0),
+            torch.from_numpy(np.array(next_state, dtype=np.float32)).unsqueeze(dim=0),
+            torch.Tensor([reward]),
+            torch.Tensor([done]),
+            mask,
+        )
+        return self._buffer.able_sample()
+
+    def sample_buffer(self, nb_batches=1):
+        dataset = self._buffer.sample_batches(nb_batches)
+        return self.unpack_batches(dataset) + (dataset.mask.float().to(self._device),)
+
+    def compute_loss(self, states, actions, next_states, rewards, discounts, masks):
+        # (batch, nb_nets, actions) for every head in one pass
+        curr_Q1 = self._model1(states).gather(2, actions.unsqueeze(dim=1).expand(-1, self.nb_nets, 1)).squeeze(dim=-1)
+        curr_Q2 = self._model2(states).gather(2, actions.unsqueeze(dim=1).expand(-1, self.nb_nets, 1)).squeeze(dim=-1)
+
+        with inference_mode():
+            target1, target2 = self.target_models()
+            next_Q = torch.min(
+                torch.max(target1(next_states), 2)[0],
+                torch.max(target2(next_states), 2)[0],
+            )
+        expected_Q = rewards.unsqueeze(dim=-1) + discounts.unsqueeze(dim=-1) * next_Q
+
+        # Every head only learns from the transitions of its bootstrap sample
+        nb_samples = masks.sum(dim=0).clamp(min=1)
+        loss1 = torch.mean(torch.sum(masks * (curr_Q1 - expected_Q) ** 2, dim=0) / nb_samples)
+        loss2 = torch.mean(torch.sum(masks * (curr_Q2 - expected_Q) ** 2, dim=0) / nb_samples)
+
+        return loss1, loss2
@@ -0,0 +1,36 @@
+import torch
+
+from .base_agent import BaseAgent
+
+class SamplingAgent(BaseAgent):
+    def __init__(self, **kwargs):
+        """Agent of a stochastic model, its nb_nets forward passes run as a single tiled batch"""
+        super(SamplingAgent, self).__init__(**kwargs)
+
+    def forward(self, model, state: torch.Tensor):
+        return model(state)
+
+    def sample_values(self, state: torch.Tensor):
+        """Q values of nb_nets stochastic passes, of shape (nb_nets, batch, actions)"""
+        tiled = state.repeat((self.nb_nets,) + (1,) * (state.dim() - 1))
+        return self.forward(self._model1, tiled).view(self.nb_nets, state.shape[0], -1)
+
+    def chose_action(self, state: torch.Tensor):
+        values = self.sample_values(state).mean(dim=0)
+        _, index = torch.max(values, dim=-1)
+        return index
+
+    def get_uncert_batch(self, states: torch.Tensor):
+        values = self.sample_values(states)
+        _, index = torch.max(values.mean(dim=0), dim=-1)
+
+        # Q value of the selected action for every pass
+        samples = values.gather(2, index.view(1, -1, 1).expand(self.nb_nets, -1, 1))
+        epistemic = torch.var(samples, dim=0).squeeze(dim=-1)
+
+        aleatoric = torch.zeros_like(epistemic)
+        return index, (epistemic, aleatoric)
+
+    def load(self, path, eval_mode=False):
+        # Sampling needs the stochastic layers active
+        return super(SamplingAgent, self).load(path, eval_mode=False)
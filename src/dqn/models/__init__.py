@@ -2,6 +2,8 @@ from .model import Model
 from .aleatoric import Aleatoric
 from .dropout import Dropout
 from .bnn import BNN
+from .ensemble import EnsembleModel, EnsembleMember
+from .multihead import MultiHead
 from shared.models.vae import VAE
 
 class VAEModel:
@@ -44,6 +46,7 @@ def make_model(
         'dropout2': Dropout,
         'bootstrap': Bootstrap,
         'bootstrap2': Bootstrap2,
+        'multihead': MultiHead,
         'sensitivity': Model,
         'bnn': BNN,
         'aleatoric': Aleatoric,
@@ -1,7 +1,7 @@
 import torch
 import torch.nn as nn
 import torchbnn as bnn
-from shared.models.bnn import BNNBase
+from shared.models.bnn import BNNBase, sample_forward
 
 class BNN(nn.Module):
     def __init__(self, state_stack, input_dim=11, output_dim=1, architecture=[256, 128, 64], **kwargs):
@@ -14,8 +14,11 @@ class BNN(nn.Module):
             nn.Softplus()
         )
     
-    def forward(self, x: torch.Tensor):
+    def forward(self, x: torch.Tensor, per_sample=False):
+        """Q values, with per_sample every row uses its own weights sample instead of sharing one"""
         x = x.view(x.shape[0], -1)
+        if per_sample:
+            return sample_forward(list(self.base.fc) + list(self.v), x)
         x = self.base(x)
         v = self.v(x)
         return v
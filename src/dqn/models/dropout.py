@@ -7,8 +7,11 @@ class Dropout(nn.Module):
         super(Dropout, self).__init__()
         p =  0.25
         self.model = Model(state_stack, input_dim=input_dim, output_dim=output_dim, architecture=architecture, p=p, **kwargs)
+        # Base only drops between hidden layers, a single hidden layer would have no dropout at all
+        self.dropout = nn.Dropout(p=p)
 
     def forward(self, x: torch.Tensor):
         x = x.view(x.shape[0], -1)
-        v = self.model(x)
+        x = self.dropout(self.model.base(x))
+        v = self.model.v(x)
         return v
\ No newline at end of file
@@ -0,0 +1,104 @@
+import torch
+import torch.nn as nn
+
+
+def leaf_modules(model: nn.Module):
+    """(name, module) of the layers of a model, in the order they are applied"""
+    return [(name, module) for name, module in model.named_modules() if not list(module.children())]
+
+
+class EnsembleLinear(nn.Module):
+    def __init__(self, nb_members, in_features, out_features):
+        """Linear layers of several networks evaluated in one batched matmul"""
+        super(EnsembleLinear, self).__init__()
+        self.weight = nn.Parameter(torch.empty(nb_members, in_features, out_features))
+        self.bias = nn.Parameter(torch.empty(nb_members, 1, out_features))
+
+    @classmethod
+    def from_linears(cls, linears):
+        layer = cls(len(linears), linears[0].in_features, linears[0].out_features).to(linears[0].weight.device)
+        with torch.no_grad():
+            layer.weight.copy_(torch.stack([linear.weight.t() for linear in linears]))
+            layer.bias.copy_(torch.stack([linear.bias.unsqueeze(dim=0) for linear in linears]))
+        return layer
+
+    def forward(self, x):
+        # (nb_members, batch, in_features) -> (nb_members, batch, out_features)
+        return torch.baddbmm(self.bias, x, self.weight)
+
+    def member(self, x, idx):
+        return torch.addmm(self.bias[idx], x, self.weight[idx])
+
+
+class EnsembleModel(nn.Module):
+    def __init__(self, models):
+        """Stack networks of the same architecture so they run as a single network
+
+        The members must apply their leaf modules in registration order on the flattened
+        input, as Model does. Their nn.Linear are stacked, the other layers are shared.
+
+        Args:
+            models (list): Networks to stack, their current weights are copied
+        """
+        super(EnsembleModel, self).__init__()
+        self.nb_members = len(models)
+        members = [leaf_modules(model) for model in models]
+        self._names = [name for name, _ in members[0]]
+        layers = []
+        for idx, (_, layer) in enumerate(members[0]):
+            if isinstance(layer, nn.Linear):
+                layer = EnsembleLinear.from_linears([member[idx][1] for member in members])
+            else:
+                assert not list(layer.parameters()), f"Cannot stack the {type(layer).__name__} layer {self._names[idx]}"
+            layers.append(layer)
+        self.layers = nn.ModuleList(layers)
+
+    def forward(self, x):
+        """Q values of every member for the same batch
+
+        Returns:
+            torch.Tensor: (nb_members, batch, outputs)
+        """
+        x = x.view(1, x.shape[0], -1).expand(self.nb_members, -1, -1)
+        for layer in self.layers:
+            x = layer(x)
+        return x
+
+    def member_forward(self, x, idx):
+        x = x.view(x.shape[0], -1)
+        for layer in self.layers:
+            x = layer.member(x, idx) if isinstance(layer, EnsembleLinear) else layer(x)
+        return x
+
+    def member_state_dict(self, idx):
+        """State dict of a member in the format of the stacked networks"""
+        state = {}
+        for name, layer in zip(self._names, self.layers):
+            if isinstance(layer, EnsembleLinear):
+                state[f"{name}.weight"] = layer.weight[idx].detach().t().clone()
+                state[f"{name}.bias"] = layer.bias[idx, 0].detach().clone()
+        return state
+
+    def load_member_state_dict(self, idx, state):
+        with torch.no_grad():
+            for name, layer in zip(self._names, self.layers):
+                if isinstance(layer, EnsembleLinear):
+                    layer.weight[idx].copy_(state[f"{name}.weight"].t())
+                    layer.bias[idx, 0].copy_(state[f"{name}.bias"])
+
+
+class EnsembleMember(nn.Module):
+    def __init__(self, ensemble: EnsembleModel, idx: int):
+        """One network of an EnsembleModel, usable and checkpointed like the original network"""
+        super(EnsembleMember, self).__init__()
+        self.ensemble = ensemble
+        self._idx = idx
+
+    def forward(self, x):
+        return self.ensemble.member_forward(x, self._idx)
+
+    def state_dict(self, *args, **kwargs):
+        return self.ensemble.member_state_dict(self._idx)
+
+    def load_state_dict(self, state_dict, strict=True):
+        self.ensemble.load_member_state_dict(self._idx, state_dict)
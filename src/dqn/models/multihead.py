@@ -0,0 +1,21 @@
+import torch.nn as nn
+from shared.models.base import Base
+
+class MultiHead(nn.Module):
+    def __init__(self, state_stack, input_dim=11, output_dim=1, architecture=[256, 128, 64], nb_nets=10, **kwargs):
+        super(MultiHead, self).__init__()
+        self.nb_nets = nb_nets
+        self.output_dim = output_dim
+        self.base = Base(state_stack, input_dim, architecture=architecture)
+        # Every head of the bootstrap in a single layer
+        self.v = nn.Sequential(
+            nn.Linear(architecture[-1], nb_nets * output_dim),
+            nn.Softplus()
+        )
+
+    def forward(self, x):
+        """Q values of every head, of shape (batch, nb_nets, output_dim)"""
+        x = x.view(x.shape[0], -1)
+        x = self.base(x)
+        v = self.v(x)
+        return v.view(x.shape[0], self.nb_nets, self.output_dim)
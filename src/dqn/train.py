@@ -4,7 +4,6 @@ import torch
 import uuid
 import glob
 from termcolor import colored
-from pyvirtualdisplay import Display
 from collections import namedtuple
 import numpy as np
 
@@ -13,25 +12,14 @@ import sys
 sys.path.append('..')
 from shared.utils.utils import init_uncert_file
 from shared.components.env import Env
-from shared.utils.replay_buffer import ReplayMemory
+from shared.utils.replay_buffer import ArrayReplayMemory, NStepMemory
 from shared.components.logger import Logger
 from components.uncert_agents import make_agent
 from components.eps_scheduler import Epsilon
+from components.action_space import ActionSpace
 from components.trainer import Trainer
 from models import make_model
 
-ACTION_RANGE = [-3, 3]
-def get_actions(nb_actions, type_actions):
-    if type_actions == 'linear':
-        return np.linspace(ACTION_RANGE[0], ACTION_RANGE[1], num=nb_actions)
-    else:
-        negative_num = nb_actions//2
-        positive_num = nb_actions - negative_num
-        positive_space = np.logspace(0, 1, num=positive_num, dtype=float, base=ACTION_RANGE[1] + 1) - 1
-        negative_space = -np.logspace(0, 1, num=negative_num + 1, dtype=float, base=-ACTION_RANGE[0] + 1)[1:] + 1
-        return np.sort(np.concatenate((positive_space, negative_space)))
-
-
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Train a DDQN agent for Inverted Double Pendulum",
@@ -72,7 +60,13 @@ if __name__ == "__main__":
         "--model",
         type=str,
         default="base",
-        help='Type of uncertainty model: "base", "sensitivity", "dropout", "bootstrap", "aleatoric", "bnn" or "custom"',
+        help='Type of uncertainty model: "base", "sensitivity", "dropout", "bootstrap", "multihead", "aleatoric", "bnn" or "custom"',
+    )
+    agent_config.add_argument(
+        "-FU",
+        "--fused",
+        action="store_true",
+        help="Evaluate both Q-networks in one batched pass with a single backward, base model only",
     )
     agent_config.add_argument(
         "-NN",
@@ -81,9 +75,19 @@ if __name__ == "__main__":
         default=10,
         help="Number of networks to estimate uncertainties",
     )
+    agent_config.add_argument(
+        "-MP",
+        "--mask-prob",
+        type=float,
+        default=0.5,
+        help="Probability that a head of the multihead model trains on a transition",
+    )
     agent_config.add_argument(
         "-G", "--gamma", type=float, default=0.99, help="discount factor"
     )
+    agent_config.add_argument(
+        "-NS", "--n-steps", type=int, default=1, help="Steps of the returns used as targets"
+    )
     agent_config.add_argument(
         "-SS", "--state-stack", type=int, default=6, help="Number of state stack as observation"
     )
@@ -91,7 +95,14 @@ if __name__ == "__main__":
         "-AC", "--actions", type=int, default=30, help="Number Actions"
     )
     agent_config.add_argument(
-        "-TA", "--type-actions", type=str, default="log", help="How to split action space, can be 'linear' or 'log'"
+        "-TA", "--type-actions", type=str, default="log", help="How to split action space, can be 'linear', 'log' or 'quantile'"
+    )
+    agent_config.add_argument(
+        "-AS",
+        "--action-samples",
+        type=str,
+        default=None,
+        help="Numpy file of continuous actions, the quantile action space puts one action per quantile",
     )
     agent_config.add_argument(
         "-A",
@@ -177,12 +188,45 @@ if __name__ == "__main__":
         action="store_true",
         help="render the environment on evaluation",
     )
+    train_config.add_argument(
+        "-OR",
+        "--offscreen-render",
+        action="store_true",
+        help="record rendered episodes offscreen with ffmpeg instead of starting a virtual display",
+    )
     train_config.add_argument(
         "-DB",
         "--debug",
         action="store_true",
         help="debug mode",
     )
+    train_config.add_argument(
+        "-RN",
+        "--run-name",
+        type=str,
+        default=None,
+        help="Name used for checkpoints and uncertainty files, defaults to the model name and run id",
+    )
+
+    # Logging
+    log_config = parser.add_argument_group("Log config")
+    log_config.add_argument(
+        "-LB",
+        "--log-backend",
+        type=str,
+        default="wandb",
+        help='Where metrics are sent: "wandb" or "offline" to write a jsonl file',
+    )
+    log_config.add_argument(
+        "-LD", "--log-dir", type=str, default="logs", help="Folder of the offline logs"
+    )
+    log_config.add_argument(
+        "-LA",
+        "--log-aggregate",
+        type=int,
+        default=1,
+        help="Average loss metrics over this many updates before logging them",
+    )
 
     # Update
     update_config = parser.add_argument_group("Update config")
@@ -195,11 +239,38 @@ if __name__ == "__main__":
     update_config.add_argument(
         "-LR", "--learning-rate", type=float, default=0.001, help="Learning Rate"
     )
+    update_config.add_argument(
+        "-TU",
+        "--target-update",
+        type=int,
+        default=0,
+        help="Updates between copies of the online networks to target networks, 0 bootstraps from the online networks",
+    )
+    update_config.add_argument(
+        "-TAU",
+        "--tau",
+        type=float,
+        default=None,
+        help="Polyak averaging factor of the target networks after every update, replaces the periodic copies",
+    )
+    update_config.add_argument(
+        "-NU",
+        "--nb-updates",
+        type=int,
+        default=1,
+        help="Gradient steps every update interval, their minibatches are sampled at once",
+    )
+    update_config.add_argument(
+        "-UE", "--update-every", type=int, default=1, help="Environment steps between updates"
+    )
 
     args = parser.parse_args()
+    # The fused agent stacks plain Q-networks, it has none of the other agents' uncertainty estimates
+    if args.fused and args.model != "base":
+        parser.error(f'--fused only supports the "base" model, not "{args.model}"')
     
     run_id = uuid.uuid4()
-    run_name = f"{args.model}_{run_id}"
+    run_name = args.run_name if args.run_name else f"{args.model}_{run_id}"
     # run_name = args.model
     render_path = "render"
     render_model_path = f"{render_path}/train"
@@ -207,7 +278,7 @@ if __name__ == "__main__":
     param_path = "param"
     uncertainties_path = "uncertainties"
     uncertainties_train_path = f"{uncertainties_path}/eval"
-    uncertainties_file_path = f"{uncertainties_train_path}/{run_name}.txt"
+    uncertainties_file_path = f"{uncertainties_train_path}/{run_name}.trace"
 
     print(colored("Initializing data folders", "blue"))
     # Init model checkpoint folder and uncertainties folder
@@ -222,19 +293,17 @@ if __name__ == "__main__":
             os.makedirs(render_model_path)
         if not os.path.exists(train_render_model_path):
             os.makedirs(train_render_model_path)
-        else:
+        elif not args.from_checkpoint:
             files = glob.glob(f"{train_render_model_path}/*")
             for f in files:
                 os.remove(f)
         if not os.path.exists(uncertainties_train_path):
             os.makedirs(uncertainties_train_path)
-        init_uncert_file(file=uncertainties_file_path)
+        # A resumed run keeps appending to its eval trace
+        if not args.from_checkpoint or not os.path.exists(uncertainties_file_path):
+            init_uncert_file(file=uncertainties_file_path)
     print(colored("Data folders created successfully", "green"))
 
-    # Virtual display
-    display = Display(visible=0, size=(1400, 900))
-    display.start()
-
     # Whether to use cuda or cpu
     if args.device == "auto":
         torch.cuda.empty_cache()
@@ -248,11 +317,25 @@ if __name__ == "__main__":
     print(colored(f"Using: {device}", "green"))
 
     # Init logger
-    logger = Logger("inv-pendulum-dqn", args.model, run_name, str(run_id), args=vars(args))
+    logger = Logger(
+        "inv-pendulum-dqn",
+        args.model,
+        run_name,
+        str(run_id),
+        args=vars(args),
+        backend=args.log_backend,
+        log_dir=args.log_dir,
+        aggregate_every=args.log_aggregate,
+    )
     config = logger.get_config()
 
     # Actions
-    actions = get_actions(config["actions"], config["type_actions"])
+    actions = ActionSpace.make(
+        config["actions"],
+        config["type_actions"],
+        samples=np.load(config["action_samples"]) if config["action_samples"] else None,
+        device=device,
+    )
 
     # Noise parser
     if config["noise"]:
@@ -274,17 +357,25 @@ if __name__ == "__main__":
         action_repeat=config["action_repeat"],
         seed=config["eval_seed"],
         path_render=train_render_model_path if config["eval_render"] else None,
+        offscreen_render=config["offscreen_render"],
         evaluations=config["evaluations"],
         done_reward_threshold=-1000
     )
-    Transition = namedtuple(
-        "Transition", ("state", "action", "next_state", "reward", "done")
-    )
-    buffer = ReplayMemory(
+    fields = ("state", "action", "next_state", "reward", "done")
+    if config["model"] == "multihead":
+        # Bootstrap mask of the heads
+        fields += ("mask",)
+    if config["n_steps"] > 1:
+        # Discount of the bootstrap of every n-step transition
+        fields += ("discount",)
+    Transition = namedtuple("Transition", fields)
+    buffer = ArrayReplayMemory(
         config["buffer_capacity"],
         config["batch_size"],
         Transition
     )
+    if config["n_steps"] > 1:
+        buffer = NStepMemory(buffer, config["n_steps"], config["gamma"])
     epsilon = Epsilon(
         max_steps=config["epsilon_max_steps"],
         method=config["epsilon_method"],
@@ -299,6 +390,7 @@ if __name__ == "__main__":
         input_dim=env.observation_dims,
         output_dim=len(actions),
         architecture=architecture,
+        nb_nets=config["nb_nets"],
     ).to(device)
     model2 = make_model(
         model=config["model"],
@@ -306,8 +398,10 @@ if __name__ == "__main__":
         input_dim=env.observation_dims,
         output_dim=len(actions),
         architecture=architecture,
+        nb_nets=config["nb_nets"],
     ).to(device)
     agent = make_agent(
+        agent="fused" if config["fused"] else config["model"],
         model1=model1,
         model2=model2,
         gamma=config["gamma"],
@@ -318,6 +412,9 @@ if __name__ == "__main__":
         device=device,
         lr=config["learning_rate"],
         nb_nets=config["nb_nets"],
+        mask_prob=config["mask_prob"],
+        target_update=config["target_update"],
+        tau=config["tau"],
     )
     init_epoch = 0
     if config["from_checkpoint"]:
@@ -354,8 +451,13 @@ if __name__ == "__main__":
         model_name=run_name,
         checkpoint_every=10,
         debug=config["debug"],
+        nb_updates=config["nb_updates"],
+        update_every=config["update_every"],
     )
 
+    if config["from_checkpoint"]:
+        trainer.load_training_state(config["from_checkpoint"])
+
     trainer.run()
     env.close()
     eval_env.close()
\ No newline at end of file
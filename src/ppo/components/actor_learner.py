@@ -0,0 +1,315 @@
+import queue
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.multiprocessing as mp
+from tqdm import tqdm
+
+from shared.components.env import Env
+from shared.components.logger import Logger
+from shared.utils.adjust_range import adjust_range
+from shared.utils.arena import flat_view
+from components.uncert_agents import make_agent
+from components.uncert_agents.base_agent import BaseAgent
+from components.trainer import Trainer
+from models import make_model
+
+
+def get_networks(model):
+    """List the torch modules behind a model returned by make_model or stored in an agent"""
+    if isinstance(model, nn.Module):
+        return [model]
+    if isinstance(model, list):
+        return model
+    return [model.model, model.vae]
+
+
+class ParameterBlock:
+    def __init__(self, networks: "list", ctx=mp) -> None:
+        """Versioned shared memory copy of the weights of a set of networks
+
+        Args:
+            networks (list): Modules whose floating point state is broadcast
+            ctx (optional): Multiprocessing context. Defaults to torch.multiprocessing.
+        """
+        numel = sum(t.numel() for t in self._tensors(networks))
+        self._flat = torch.zeros(numel).share_memory_()
+        self._version = ctx.Value("l", 0, lock=False)
+        self._lock = ctx.Lock()
+
+    @staticmethod
+    def _tensors(networks):
+        return [
+            t for net in networks for t in net.state_dict().values() if t.is_floating_point()
+        ]
+
+    def get_version(self):
+        return self._version.value
+
+    def publish(self, networks):
+        tensors = self._tensors(networks)
+        # Networks packed by a ParameterArena are published with a single copy
+        flat = flat_view(tensors)
+        with self._lock:
+            if flat is not None:
+                self._flat.copy_(flat)
+            else:
+                offset = 0
+                for t in tensors:
+                    self._flat[offset : offset + t.numel()].copy_(t.reshape(-1))
+                    offset += t.numel()
+            self._version.value += 1
+
+    def pull(self, networks, version):
+        """Copy the shared weights into networks if they are newer than version
+
+        Returns:
+            int: Version of the weights now held by networks
+        """
+        if self._version.value == version:
+            return version
+        tensors = self._tensors(networks)
+        flat = flat_view(tensors)
+        with self._lock:
+            if flat is not None:
+                flat.copy_(self._flat)
+            else:
+                offset = 0
+                for t in tensors:
+                    t.copy_(self._flat[offset : offset + t.numel()].view_as(t))
+                    offset += t.numel()
+            return self._version.value
+
+
+class SharedRolloutBuffer:
+    def __init__(self, capacity: int, state_dim: int, action_dim: int, nb_slots: int = 2, ctx=mp) -> None:
+        """Shared memory rollout storage written by actors and consumed by the learner
+
+        Slots are filled and consumed in round robin, so actors keep collecting into
+        the next slot while the learner updates on a full one.
+
+        Args:
+            capacity (int): Transitions per slot, the PPO buffer capacity
+            state_dim (int): Flattened state size
+            action_dim (int): Action size
+            nb_slots (int, optional): Number of rollout slots. Defaults to 2.
+            ctx (optional): Multiprocessing context. Defaults to torch.multiprocessing.
+        """
+        self._capacity = capacity
+        self._nb_slots = nb_slots
+
+        self.state = torch.zeros(nb_slots, capacity, state_dim).share_memory_()
+        self.action = torch.zeros(nb_slots, capacity, action_dim).share_memory_()
+        self.reward = torch.zeros(nb_slots, capacity).share_memory_()
+        self.next_state = torch.zeros(nb_slots, capacity, state_dim).share_memory_()
+        self.a_logp = torch.zeros(nb_slots, capacity).share_memory_()
+        self.version = torch.zeros(nb_slots, capacity, dtype=torch.int64).share_memory_()
+
+        self._count = ctx.Array("i", nb_slots, lock=False)
+        self._write_slot = ctx.Value("i", 0, lock=False)
+        self._cond = ctx.Condition()
+
+    def push(self, state, action, reward, next_state, a_logp, version, stop_event=None):
+        """Store a transition, waiting while every slot is full
+
+        Returns:
+            bool: False if stop_event was set before the transition could be stored
+        """
+        with self._cond:
+            while self._count[self._write_slot.value] == self._capacity:
+                if stop_event is not None and stop_event.is_set():
+                    return False
+                self._cond.wait(0.1)
+            slot = self._write_slot.value
+            idx = self._count[slot]
+            self.state[slot, idx] = torch.from_numpy(np.array(state, dtype=np.float32)).view(-1)
+            self.action[slot, idx] = torch.from_numpy(np.array(action, dtype=np.float32)).view(-1)
+            self.reward[slot, idx] = float(reward)
+            self.next_state[slot, idx] = torch.from_numpy(np.array(next_state, dtype=np.float32)).view(-1)
+            self.a_logp[slot, idx] = float(a_logp)
+            self.version[slot, idx] = version
+            self._count[slot] = idx + 1
+            if idx + 1 == self._capacity:
+                self._write_slot.value = (slot + 1) % self._nb_slots
+                self._cond.notify_all()
+        return True
+
+    def wait_full(self, slot, timeout=None):
+        with self._cond:
+            if self._count[slot] < self._capacity:
+                self._cond.wait(timeout)
+            return self._count[slot] == self._capacity
+
+    def take(self, slot):
+        """Copy a full slot out of shared memory and hand it back to the actors"""
+        rollout = (
+            self.state[slot].clone(),
+            self.action[slot].clone(),
+            self.reward[slot].clone(),
+            self.next_state[slot].clone(),
+            self.a_logp[slot].clone(),
+            self.version[slot].clone(),
+        )
+        with self._cond:
+            self._count[slot] = 0
+            self._cond.notify_all()
+        return rollout
+
+
+class _ActorLogger:
+    def watch(self, model):
+        pass
+
+    def log(self, to_log: dict):
+        pass
+
+
+def actor_worker(rank, env_kwargs, model_kwargs, agent_kwargs, buffer, parameters, episodes, stop_event):
+    torch.set_num_threads(1)
+    env_kwargs = dict(env_kwargs, seed=env_kwargs["seed"] + rank)
+    env = Env(**env_kwargs)
+    agent = make_agent(
+        model=make_model(**model_kwargs),
+        buffer=None,
+        logger=_ActorLogger(),
+        device="cpu",
+        **agent_kwargs,
+    )
+    networks = get_networks(agent._model)
+    version = parameters.pull(networks, -1)
+
+    while not stop_event.is_set():
+        score = 0
+        steps = 0
+        state = env.reset()
+
+        for _ in range(1000):
+            version = parameters.pull(networks, version)
+            action, a_logp = agent.select_action(state)[:2]
+            state_, reward, done, die = env.step(adjust_range(action, target_range=env.observation_space))[:4]
+            if not buffer.push(state, action, reward, state_, a_logp, version, stop_event):
+                break
+            score += reward
+            steps += 1
+            state = state_
+
+            if done or die:
+                break
+        if not stop_event.is_set():
+            episodes.put((rank, score, steps))
+    env.close()
+
+
+class ActorLearnerTrainer(Trainer):
+    def __init__(
+        self,
+        agent: BaseAgent,
+        eval_env: Env,
+        logger: Logger,
+        episodes: int,
+        env_kwargs: dict,
+        model_kwargs: dict,
+        agent_kwargs: dict,
+        nb_actors: int = 4,
+        nb_slots: int = 2,
+        **kwargs,
+    ) -> None:
+        """PPO trainer where actor processes collect rollouts while the learner updates
+
+        Actors act with a copy of the policy that may be one update behind. The ratio
+        in the PPO loss uses the a_logp stored by the actor, so stale rollouts are
+        importance corrected and clipped like regular ones.
+
+        Args:
+            agent (BaseAgent): Learner agent
+            eval_env (Env): Evaluation environment, used by the learner
+            logger (Logger): Logger
+            episodes (int): Number of training episodes summed over actors
+            env_kwargs (dict): Env arguments of the actors, each actor offsets the seed by its rank
+            model_kwargs (dict): make_model arguments
+            agent_kwargs (dict): make_agent arguments, without model, buffer, logger and device
+            nb_actors (int, optional): Number of actor processes. Defaults to 4.
+            nb_slots (int, optional): Number of rollout slots. Defaults to 2.
+        """
+        super().__init__(agent, None, eval_env, logger, episodes, **kwargs)
+        self._env_kwargs = env_kwargs
+        self._model_kwargs = model_kwargs
+        self._agent_kwargs = agent_kwargs
+        self._nb_actors = nb_actors
+        self._nb_slots = nb_slots
+
+    def run(self):
+        ctx = mp.get_context("spawn")
+        networks = get_networks(self._agent._model)
+        parameters = ParameterBlock(networks, ctx=ctx)
+        parameters.publish(networks)
+
+        probe = Env(**dict(self._env_kwargs, noise=None))
+        state_dim = probe.state_stack.maxlen * probe.observation_dims
+        action_dim = probe.action_dims
+        probe.close()
+        buffer = SharedRolloutBuffer(
+            self._agent._buffer._capacity, state_dim, action_dim, nb_slots=self._nb_slots, ctx=ctx
+        )
+        episodes = ctx.Queue()
+        stop_event = ctx.Event()
+
+        actors = [
+            ctx.Process(
+                target=actor_worker,
+                args=(
+                    rank,
+                    self._env_kwargs,
+                    self._model_kwargs,
+                    self._agent_kwargs,
+                    buffer,
+                    parameters,
+                    episodes,
+                    stop_event,
+                ),
+                daemon=True,
+            )
+            for rank in range(self._nb_actors)
+        ]
+        for actor in actors:
+            actor.start()
+
+        i_ep = self._init_ep
+        slot = 0
+        progress = tqdm(total=self._nb_episodes - self._init_ep, desc='Training')
+        try:
+            while i_ep < self._nb_episodes:
+                if buffer.wait_full(slot, timeout=0.01):
+                    self._learn(buffer.take(slot), parameters, networks, action_dim)
+                    slot = (slot + 1) % self._nb_slots
+
+                solved = False
+                while i_ep < self._nb_episodes and not solved:
+                    try:
+                        _, score, steps = episodes.get_nowait()
+                    except queue.Empty:
+                        break
+                    solved = self._end_episode(i_ep, score, steps)
+                    i_ep += 1
+                    progress.update()
+                if solved:
+                    break
+        finally:
+            progress.close()
+            stop_event.set()
+            for actor in actors:
+                actor.join(timeout=10)
+                if actor.is_alive():
+                    actor.terminate()
+
+    def _learn(self, rollout, parameters, networks, action_dim):
+        states, actions, rewards, next_states, a_logps, versions = rollout
+        action_shape = () if action_dim == 1 else (action_dim,)
+        self._agent.store_rollout(
+            states, actions.view((-1,) + action_shape), rewards, next_states, a_logps
+        )
+        lag = float(torch.mean((parameters.get_version() - versions).float()))
+        self._agent.update()
+        self._agent.empty_buffer()
+        parameters.publish(networks)
+        self._logger.log({"Policy Lag": lag, "Policy Version": parameters.get_version()})
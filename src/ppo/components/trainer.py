@@ -1,7 +1,10 @@
+import os
+import pickle
 import numpy as np
 from tqdm import tqdm
 
-from shared.utils.utils import save_uncert
+from shared.utils.utils import save_uncert, get_rng_state, set_rng_state
+from shared.components.checkpointer import get_checkpointer
 from shared.components.evaluator import Evaluator
 from components.uncert_agents.base_agent import BaseAgent
 from shared.components.env import Env
@@ -39,21 +42,20 @@ class Trainer:
 
         self.best_model_path = f"param/best_{model_name}.pkl"
         self.checkpoint_model_path = f"param/checkpoint_{self._model_name}.pkl"
+        self._checkpoint_base_path = f"param/checkpoint_{self._model_name}"
 
         self._best_score = -100
         self._eval_nb = 0
         self._max_running_score = 0
+        self._running_score = 0
 
-    def run(self):
-        running_score = 0
+    def get_max_running_score(self):
+        return self._max_running_score
 
+    def run(self):
         for i_ep in tqdm(range(self._init_ep, self._nb_episodes), 'Training'):
-            metrics = {
-                "Train Episode": i_ep,
-                "Episode Running Score": float(running_score),
-                "Episode Score": 0,
-                "Episode Steps": 0,
-            }
+            score = 0
+            steps = 0
             state = self._env.reset()
 
             for _ in range(1000):
@@ -62,40 +64,94 @@ class Trainer:
                 if self._agent.store_transition(state, action, reward, state_, a_logp):
                     self._agent.update()
                     self._agent.empty_buffer()
-                metrics["Episode Score"] += reward
-                metrics["Episode Steps"] += 1
+                score += reward
+                steps += 1
                 state = state_
 
                 if done or die:
                     break
-            running_score = running_score * 0.99 + metrics["Episode Score"] * 0.01
-            if running_score > self._max_running_score:
-                self._max_running_score = running_score
-            metrics["Episode Running Score"] = running_score
-            metrics["Max Episode Running Score"] = self._max_running_score
-            self._logger.log(metrics)
-
-            # Eval agent
-            if (i_ep + 1) % self._eval_interval == 0:
-                eval_score = self.eval(i_ep)
-
-                if eval_score > self._best_score and not self._debug:
-                    self._agent.save(i_ep, path=self.best_model_path)
-                    self._best_score = eval_score
-            # Save checkpoint
-            if (i_ep + 1) % self._checkpoint_every == 0 and not self._debug:
-                self._agent.save(i_ep, path=self.checkpoint_model_path)
-            # Stop training
-            if running_score > self._env.reward_threshold:
-                print(
-                    "Solved! Running reward is now {} and the last episode runs to {}!".format(
-                        running_score, metrics["Episode Score"]
-                    )
-                )
-                if not self._debug:
-                    self._agent.save(i_ep, path=self.best_model_path)
+            if self._end_episode(i_ep, score, steps):
                 break
 
+    def _end_episode(self, i_ep, score, steps):
+        """Log a finished training episode, evaluate and save checkpoints
+
+        Returns:
+            bool: Whether the environment is solved and training should stop
+        """
+        self._running_score = self._running_score * 0.99 + score * 0.01
+        if self._running_score > self._max_running_score:
+            self._max_running_score = self._running_score
+        metrics = {
+            "Train Episode": i_ep,
+            "Episode Running Score": self._running_score,
+            "Episode Score": score,
+            "Episode Steps": steps,
+            "Max Episode Running Score": self._max_running_score,
+        }
+        self._logger.log(metrics)
+
+        # Eval agent
+        if (i_ep + 1) % self._eval_interval == 0:
+            eval_score = self.eval(i_ep)
+
+            if eval_score > self._best_score and not self._debug:
+                self._agent.save(i_ep, path=self.best_model_path)
+                self._best_score = eval_score
+        # Save checkpoint
+        if (i_ep + 1) % self._checkpoint_every == 0 and not self._debug:
+            self.save_checkpoint(i_ep)
+        # Stop training
+        if self._running_score > self._eval_env.reward_threshold:
+            print(
+                "Solved! Running reward is now {} and the last episode runs to {}!".format(
+                    self._running_score, score
+                )
+            )
+            if not self._debug:
+                self._agent.save(i_ep, path=self.best_model_path)
+            return True
+        return False
+
+    def save_checkpoint(self, i_ep):
+        """Save the agent with everything needed to resume training after episode i_ep"""
+        self._agent.save(i_ep, path=self.checkpoint_model_path)
+        state = {
+            "episode": i_ep + 1,
+            "running_score": self._running_score,
+            "max_running_score": self._max_running_score,
+            "best_score": self._best_score,
+            "eval_nb": self._eval_nb,
+            "rng": get_rng_state(),
+            "env_rng": self._env.get_rng_state() if self._env is not None else None,
+            "agent": self._agent.get_training_state(f"{self._checkpoint_base_path}_buffer"),
+        }
+        get_checkpointer().save(state, f"{self._checkpoint_base_path}_state.pkl", dump=pickle.dump)
+
+    def load_training_state(self, checkpoint_path):
+        """Resume from the training state saved along checkpoint_path, if any
+
+        The agent must already be loaded from checkpoint_path and init_ep set to its epoch.
+        """
+        get_checkpointer().flush()
+        base_path = os.path.splitext(checkpoint_path)[0]
+        if not os.path.exists(f"{base_path}_state.pkl"):
+            return
+        with open(f"{base_path}_state.pkl", "rb") as f:
+            state = pickle.load(f)
+        if state["episode"] != self._init_ep + 1:
+            print(f"Training state of {checkpoint_path} does not match its model, ignoring it")
+            return
+        self._init_ep = state["episode"]
+        self._running_score = state["running_score"]
+        self._max_running_score = state["max_running_score"]
+        self._best_score = state["best_score"]
+        self._eval_nb = state["eval_nb"]
+        self._agent.load_training_state(state["agent"], f"{base_path}_buffer")
+        set_rng_state(state["rng"])
+        if self._env is not None and state["env_rng"] is not None:
+            self._env.set_rng_state(state["env_rng"])
+
     def eval(self, episode_nb, mode='eval'):
         assert mode in ['train', 'eval', 'test0', 'test']
         if self._evaluator:
@@ -124,7 +180,7 @@ class Trainer:
                 uncert.append(
                     [epis.view(-1).cpu().numpy()[0], aleat.view(-1).cpu().numpy()[0]]
                 )
-                state_, reward, _, die = self._eval_env.step(adjust_range(action, target_range=self._env.observation_space))[:4]
+                state_, reward, _, die = self._eval_env.step(adjust_range(action, target_range=self._eval_env.observation_space))[:4]
                 score += reward
                 state = state_
                 steps += 1
@@ -136,7 +192,7 @@ class Trainer:
                     i_val,
                     score,
                     uncert,
-                    file=f"uncertainties/{mode}/{self._model_name}.txt",
+                    file=f"uncertainties/{mode}/{self._model_name}.trace",
                     sigma=self._eval_env.random_noise,
                 )
 
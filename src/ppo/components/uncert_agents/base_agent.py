@@ -8,6 +8,7 @@ import numpy as np
 
 from shared.utils.replay_buffer import ReplayMemory
 from shared.components.logger import Logger
+from shared.components.checkpointer import get_checkpointer
 
 class BaseAgent:
     def __init__(
@@ -43,6 +44,7 @@ class BaseAgent:
             logger.watch(model)
         self._nb_update = 0
         self.training_step = 0
+        self._checkpointer = get_checkpointer()
 
     def select_action(self, state: np.ndarray, eval=False):
         state = torch.from_numpy(state).float().to(self._device).unsqueeze(0)
@@ -83,6 +85,25 @@ class BaseAgent:
         )
         return self._buffer.is_memory_full()
 
+    def store_rollout(self, states, actions, rewards, next_states, a_logps):
+        """Store a batch of transitions with a single write per field
+
+        Args:
+            states (Tensor): Flattened states of shape (N, S)
+            actions (Tensor): Actions of shape (N, A), or (N,) for a scalar action
+            rewards (Tensor): Rewards of shape (N,)
+            next_states (Tensor): Flattened next states of shape (N, S)
+            a_logps (Tensor): Log probabilities of the actions of shape (N,)
+        """
+        self._buffer.push_batch(
+            states.float().flatten(start_dim=1),
+            actions.float(),
+            rewards.float(),
+            next_states.float().flatten(start_dim=1),
+            a_logps.float(),
+        )
+        return self._buffer.is_memory_full()
+
     def empty_buffer(self):
         self._buffer.empty()
 
@@ -91,11 +112,24 @@ class BaseAgent:
             "epoch": epoch,
             "model_state_dict": self._model.state_dict(),
             "optimizer_state_dict": self._optimizer.state_dict(),
-            # TODO: Save buffer
         }
-        torch.save(tosave, path)
+        self._checkpointer.save(tosave, path, key=(epoch, self._nb_update), owner=self)
+
+    def get_training_state(self, path):
+        """Training progress not held by model checkpoints, the buffer is saved in the folder path"""
+        return {
+            "training_step": self.training_step,
+            "nb_update": self._nb_update,
+            "buffer": self._buffer.save(path, self._checkpointer),
+        }
+
+    def load_training_state(self, state, path):
+        self.training_step = state["training_step"]
+        self._nb_update = state["nb_update"]
+        self._buffer.load(path, state["buffer"])
 
     def load(self, path, eval_mode=False):
+        self._checkpointer.flush()
         checkpoint = torch.load(path)
         self._model.load_state_dict(checkpoint["model_state_dict"])
         self._optimizer.load_state_dict(checkpoint["optimizer_state_dict"])
@@ -108,11 +142,11 @@ class BaseAgent:
     def unpack_buffer(self):
         dataset = self._buffer.dataset()
 
-        states = torch.cat(dataset.state).float().to(self._device)
-        actions = torch.cat(dataset.action).float().to(self._device)
-        rewards = torch.cat(dataset.reward).to(self._device)
-        next_states = torch.cat(dataset.next_state).float().to(self._device)
-        a_logp = torch.cat(dataset.a_logp).to(self._device)
+        states = dataset.state.float().to(self._device)
+        actions = dataset.action.float().to(self._device)
+        rewards = dataset.reward.to(self._device)
+        next_states = dataset.next_state.float().to(self._device)
+        a_logp = dataset.a_logp.to(self._device)
 
         return states, actions, rewards, next_states, a_logp
 
@@ -151,19 +185,7 @@ class BaseAgent:
         }
         
         for index in sampler:
-            prediction = net(s[index])
-            alpha, beta = prediction[0][0].squeeze(dim=-1), prediction[0][1].squeeze(dim=-1)
-            
-            dist = Beta(alpha, beta)
-            a_logp = dist.log_prob(a[index])
-
-            ratio = torch.exp(a_logp - old_a_logp[index])
-
-            surr1 = ratio * adv[index]
-            surr2 = torch.clamp(ratio, 1.0 - self.clip_param, 1.0 + self.clip_param) * adv[index]
-            action_loss = -torch.min(surr1, surr2).mean()
-            value_loss = self.get_value_loss(prediction, target_v[index])
-            loss = action_loss + 2.0 * value_loss
+            action_loss, value_loss, loss = self.minibatch_loss(net, target_v, adv, old_a_logp, s, a, index)
 
             optimizer.zero_grad()
             loss.backward()
@@ -175,5 +197,57 @@ class BaseAgent:
             losses["Total Loss"] += loss.item()
         return losses
 
+    def train_lockstep(
+        self, nets, arena, optimizer, target_v, adv, old_a_logp, s, a, rand_samplers
+    ):
+        """Train nets whose parameters share arena, one minibatch of every net per optimizer step
+
+        The nets do not share parameters, so the summed loss gives each net the gradient
+        of its own minibatch and a single step updates them all as separate optimizers would.
+        """
+        samplers = [BatchSampler(rand_sampler, self.batch_size, False) for rand_sampler in rand_samplers]
+        losses = {
+            'Action Loss': 0,
+            'Value Loss': 0,
+            'Total Loss': 0,
+            "Update Step": self._nb_update,
+        }
+
+        for indexes in zip(*samplers):
+            total = 0
+            for net, index in zip(nets, indexes):
+                action_loss, value_loss, loss = self.minibatch_loss(net, target_v, adv, old_a_logp, s, a, index)
+                total = total + loss
+
+                losses["Action Loss"] += action_loss.item() / len(nets)
+                losses["Value Loss"] += value_loss.item() / len(nets)
+                losses["Total Loss"] += loss.item() / len(nets)
+
+            arena.zero_grad()
+            total.backward()
+            optimizer.step()
+        return losses
+
+    def minibatch_loss(self, net, target_v, adv, old_a_logp, s, a, index):
+        """Clipped surrogate loss of net on the transitions index
+
+        Returns:
+            tuple: Action loss, value loss and total loss
+        """
+        prediction = net(s[index])
+        alpha, beta = prediction[0][0].squeeze(dim=-1), prediction[0][1].squeeze(dim=-1)
+
+        dist = Beta(alpha, beta)
+        a_logp = dist.log_prob(a[index])
+
+        ratio = torch.exp(a_logp - old_a_logp[index])
+
+        surr1 = ratio * adv[index]
+        surr2 = torch.clamp(ratio, 1.0 - self.clip_param, 1.0 + self.clip_param) * adv[index]
+        action_loss = -torch.min(surr1, surr2).mean()
+        value_loss = self.get_value_loss(prediction, target_v[index])
+        loss = action_loss + 2.0 * value_loss
+        return action_loss, value_loss, loss
+
     def get_value_loss(self, prediction, target_v):
         return self._criterion(prediction[1].squeeze(dim=-1), target_v)
\ No newline at end of file
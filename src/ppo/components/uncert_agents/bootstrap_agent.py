@@ -2,6 +2,7 @@ import torch
 import torch.optim as optim
 
 from .base_agent import BaseAgent
+from shared.utils.arena import ParameterArena
 from shared.utils.losses import ll_gaussian
 from shared.utils.mixtureDist import GaussianMixture
 
@@ -12,7 +13,9 @@ class BootstrapAgent(BaseAgent):
         self._model = self._model.model
         self._criterion = ll_gaussian
         self._value_scale = 1 / nb_nets
-        self._optimizer = [optim.Adam(net.parameters(), lr=lr) for net in self._model]
+        # Every net in one flat buffer, a single optimizer steps them in lockstep
+        self._arena = ParameterArena(list(self._model))
+        self._optimizer = optim.Adam([self._arena.param], lr=lr)
         self._logger.watch(self._model[0])
 
     def chose_action(self, state: torch.Tensor):
@@ -73,12 +76,11 @@ class BootstrapAgent(BaseAgent):
         indices = [torch.randperm(self._buffer._capacity) for _ in range(self.nb_nets)]
 
         for _ in range(self.ppo_epoch):
-
-            for net, optimizer, index in zip(self._model, self._optimizer, indices):
-                losses = self.train_once(
-                    net,
-                    optimizer,
-                    target_v, adv, old_a_logp, s, a, index)
+            losses = self.train_lockstep(
+                self._model,
+                self._arena,
+                self._optimizer,
+                target_v, adv, old_a_logp, s, a, indices)
 
             self._logger.log(losses)
             self._nb_update += 1
@@ -90,21 +92,22 @@ class BootstrapAgent(BaseAgent):
 
     def save(self, epoch, path="param/ppo_net_params.pkl"):
         tosave = {'epoch': epoch}
-        for idx, (net, optimizer) in enumerate(zip(self._model, self._optimizer)):
+        for idx, net in enumerate(self._model):
             tosave['model_state_dict{}'.format(idx)] = net.state_dict()
-            tosave['optimizer_state_dict{}'.format(
-                idx)] = optimizer.state_dict()
-        torch.save(tosave, path)
+        tosave['optimizer_state_dict'] = self._optimizer.state_dict()
+        self._checkpointer.save(tosave, path, key=(epoch, self._nb_update), owner=self)
 
     def load(self, path, eval_mode=False):
+        self._checkpointer.flush()
         checkpoint = torch.load(path)
         for idx in range(len(self._model)):
             self._model[idx].load_state_dict(
                 checkpoint['model_state_dict{}'.format(idx)])
-            self._optimizer[idx].load_state_dict(
-                checkpoint['optimizer_state_dict{}'.format(idx)])
             if eval_mode:
                 self._model[idx].eval()
             else:
                 self._model[idx].train()
+        # Checkpoints with one optimizer per net restart the optimizer
+        if 'optimizer_state_dict' in checkpoint:
+            self._optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
         return checkpoint['epoch']
\ No newline at end of file
@@ -37,9 +37,10 @@ class VAEAgent(BaseAgent):
             'vae_state_dict': self._model.vae.state_dict(),
             'vae_optimizer_state_dict': self._vae_optimizer.state_dict(),
         }
-        torch.save(tosave, path)
+        self._checkpointer.save(tosave, path, key=(epoch, self._nb_update), owner=self)
 
     def load(self, path, eval_mode=False):
+        self._checkpointer.flush()
         checkpoint = torch.load(path)
         self._model.model.load_state_dict(checkpoint['model_state_dict'])
         self._optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
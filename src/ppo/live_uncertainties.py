@@ -0,0 +1,107 @@
+import os
+import glob
+import time
+import argparse
+import matplotlib
+from termcolor import colored
+
+import sys
+sys.path.append('..')
+from shared.utils.trace_tail import TraceTail
+
+
+class LiveView:
+    def __init__(self, patterns) -> None:
+        """Figure with one line per run, fed by TraceTail
+
+        Args:
+            patterns (list): Glob patterns of the watched traces, re-evaluated every refresh
+                so runs started after the viewer are picked up
+        """
+        import matplotlib.pyplot as plt
+
+        self._patterns = patterns
+        self._tails = {}
+        self._lines = {}
+
+        self.fig, self.ax = plt.subplots(nrows=3, ncols=1, sharex=True)
+        self.fig.set_figheight(12)
+        self.fig.set_figwidth(16)
+        self.fig.suptitle("Rewards and Uncertainties during training", fontsize=18)
+        self.ax[0].set_ylabel("Reward", fontsize=16)
+        self.ax[1].set_ylabel("Epistemic Uncertainty", fontsize=16)
+        self.ax[2].set_ylabel("Aleatoric Uncertainty", fontsize=16)
+        self.ax[2].set_xlabel("Episode", fontsize=16)
+
+    def _discover(self):
+        for pattern in self._patterns:
+            for path in sorted(glob.glob(pattern)):
+                if path.endswith((".idx", ".npz", ".tmp")) or path in self._tails:
+                    continue
+                name = os.path.splitext(os.path.basename(path))[0]
+                self._tails[path] = TraceTail(path)
+                self._lines[path] = [ax.plot([], [], label=name)[0] for ax in self.ax]
+                self.ax[0].legend(loc="upper left", fontsize=8)
+
+    def refresh(self):
+        """Poll every run and update the lines of those that changed
+
+        Returns:
+            int: Number of runs with new points
+        """
+        self._discover()
+        changed = 0
+        for path, tail in self._tails.items():
+            if not tail.poll().shape[0]:
+                continue
+            (unique_ep, mean_reward, mean_epist, mean_aleat), _ = tail.get_aggregates()
+            for line, values in zip(self._lines[path], (mean_reward, mean_epist, mean_aleat)):
+                line.set_data(unique_ep, values)
+            changed += 1
+        if changed:
+            for ax in self.ax:
+                ax.relim()
+                ax.autoscale_view()
+        return changed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Watch the uncertainty traces of running trainings",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        default=["uncertainties/eval/*.trace"],
+        help="Traces or legacy .txt files, glob patterns are allowed",
+    )
+    parser.add_argument(
+        "-I", "--interval", type=float, default=5, help="Seconds between refreshes"
+    )
+    parser.add_argument(
+        "-O",
+        "--output",
+        type=str,
+        default=None,
+        help="Save the figure to this file on every refresh instead of opening a window",
+    )
+    args = parser.parse_args()
+
+    if args.output:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    view = LiveView(args.paths)
+    print(colored(f"Watching {', '.join(args.paths)}", "magenta"))
+    if args.output:
+        while True:
+            if view.refresh():
+                view.fig.savefig(args.output)
+            time.sleep(args.interval)
+    else:
+        plt.ion()
+        while plt.fignum_exists(view.fig.number):
+            if view.refresh():
+                view.fig.canvas.draw_idle()
+            plt.pause(args.interval)
@@ -1,11 +1,25 @@
-import os
-import plotly.express as px
+import argparse
+from plotly.colors import qualitative
 import sys
 
 sys.path.append('../..')
+sys.path.append('..')
 from shared.utils.uncertainties import plot_uncert_train, plot_uncert_test, plotly_train, plot_uncert_comparative, plotly_test
+from shared.utils.report import Figure, ReportBuilder
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Render the uncertainty figures of the trained models",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "-W", "--workers", type=int, default=None, help="Rendering processes, defaults to the number of cpus"
+    )
+    parser.add_argument(
+        "-F", "--force", action="store_true", help="Render figures whose inputs did not change"
+    )
+    args = parser.parse_args()
+
     smooth = 2
     plot_variance = False
     train_paths = [
@@ -31,17 +45,9 @@ if __name__ == "__main__":
         "Dropout 2",
     ]
     multipliers = [1] * 10
-    colors_px = px.colors.qualitative.Plotly
+    colors_px = qualitative.Plotly
     linewidths = [2] * 10
 
-    if not os.path.exists("images"):
-        os.makedirs("images")
-
-    plot_uncert_train(
-        train_paths, names, colors=colors_px, linewidths=linewidths, smooth=smooth, plot_variance=plot_variance, multipliers=multipliers
-    )
-    plotly_train(train_paths, names, colors=colors_px, smooth=smooth, plot_variance=plot_variance)
-
     test_paths = [
         # "uncertainties/test/base.txt",
         "uncertainties/test/bnn2.txt",
@@ -54,7 +60,46 @@ if __name__ == "__main__":
         "uncertainties/test/dropout2.txt",
     ]
 
-    plot_uncert_test(test_paths, names, colors=colors_px, linewidths=linewidths, smooth=smooth, plot_variance=plot_variance, multipliers=multipliers)
-    plotly_test(test_paths, names, colors=colors_px, smooth=smooth, plot_variance=plot_variance)
+    figures = [
+        Figure(
+            "images/train.png",
+            plot_uncert_train,
+            (train_paths, names),
+            dict(colors=colors_px, linewidths=linewidths, smooth=smooth, plot_variance=plot_variance, multipliers=multipliers),
+            train_paths,
+        ),
+        Figure(
+            "images/uncertainties_train.html",
+            plotly_train,
+            (train_paths, names),
+            dict(colors=colors_px, smooth=smooth, plot_variance=plot_variance),
+            train_paths,
+        ),
+        Figure(
+            "images/test.png",
+            plot_uncert_test,
+            (test_paths, names),
+            dict(colors=colors_px, linewidths=linewidths, smooth=smooth, plot_variance=plot_variance, multipliers=multipliers),
+            test_paths,
+        ),
+        Figure(
+            "images/uncertainties_test.html",
+            plotly_test,
+            (test_paths, names),
+            dict(colors=colors_px, smooth=smooth, plot_variance=plot_variance),
+            test_paths,
+        ),
+    ]
+    # One comparative figure per model, so each one is rendered and cached on its own
+    for train_path, test_path, name in zip(train_paths, test_paths, names):
+        figures.append(
+            Figure(
+                f"images/comparative_{name}.png",
+                plot_uncert_comparative,
+                ([train_path], [test_path], [name], linewidths),
+                {},
+                [train_path, test_path],
+            )
+        )
 
-    plot_uncert_comparative(train_paths, test_paths, names, linewidths)
\ No newline at end of file
+    ReportBuilder("images", workers=args.workers, force=args.force).build(figures)
@@ -6,14 +6,13 @@ import glob
 from tqdm import tqdm
 import numpy as np
 from termcolor import colored
-from pyvirtualdisplay import Display
 from collections import namedtuple
 
 import sys
 sys.path.append('..')
 from shared.utils.utils import init_uncert_file
 from shared.components.env import Env
-from shared.utils.replay_buffer import ReplayMemory
+from shared.utils.replay_buffer import ArrayReplayMemory
 from shared.components.logger import Logger
 from shared.components.evaluator import Evaluator
 from components.uncert_agents import make_agent
@@ -57,7 +56,6 @@ if __name__ == "__main__":
         "--noise",
         type=str,
         default="0,0.1",
-        default=None,
         help='Whether to use noise or not, and standard deviation bounds separated by comma (ex. "0,0.5")',
     )
     env_config.add_argument(
@@ -145,6 +143,12 @@ if __name__ == "__main__":
         action="store_true",
         help="render the environment on evaluation",
     )
+    train_config.add_argument(
+        "-OR",
+        "--offscreen-render",
+        action="store_true",
+        help="record rendered episodes offscreen with ffmpeg instead of starting a virtual display",
+    )
     train_config.add_argument(
         "-DB",
         "--debug",
@@ -152,6 +156,26 @@ if __name__ == "__main__":
         help="debug mode",
     )
 
+    # Logging
+    log_config = parser.add_argument_group("Log config")
+    log_config.add_argument(
+        "-LB",
+        "--log-backend",
+        type=str,
+        default="wandb",
+        help='Where metrics are sent: "wandb" or "offline" to write a jsonl file',
+    )
+    log_config.add_argument(
+        "-LD", "--log-dir", type=str, default="logs", help="Folder of the offline logs"
+    )
+    log_config.add_argument(
+        "-LA",
+        "--log-aggregate",
+        type=int,
+        default=1,
+        help="Average loss metrics over this many updates before logging them",
+    )
+
     # Update
     update_config = parser.add_argument_group("Update config")
     update_config.add_argument(
@@ -199,9 +223,9 @@ if __name__ == "__main__":
     param_path = "param"
     uncertainties_path = "uncertainties"
     uncertainties_train_path = f"{uncertainties_path}/train"
-    uncertainties_file_path = f"{uncertainties_train_path}/{run_name}.txt"
+    uncertainties_file_path = f"{uncertainties_train_path}/{run_name}.trace"
     uncertainties_test_path = f"{uncertainties_path}/test"
-    uncertainties_test_file_path = f"{uncertainties_test_path}/{run_name}.txt"
+    uncertainties_test_file_path = f"{uncertainties_test_path}/{run_name}.trace"
 
     print(colored("Initializing data folders", "blue"))
     # Init model checkpoint folder and uncertainties folder
@@ -234,10 +258,6 @@ if __name__ == "__main__":
         init_uncert_file(file=uncertainties_test_file_path)
     print(colored("Data folders created successfully", "green"))
 
-    # Virtual display
-    display = Display(visible=0, size=(1400, 900))
-    display.start()
-
     # Whether to use cuda or cpu
     if args.device == "auto":
         torch.cuda.empty_cache()
@@ -251,7 +271,16 @@ if __name__ == "__main__":
     print(colored(f"Using: {device}", "green"))
 
     # Init logger
-    logger = Logger("inv-pendulum-ppo", args.model, run_name, str(run_id), args=vars(args))
+    logger = Logger(
+        "inv-pendulum-ppo",
+        args.model,
+        run_name,
+        str(run_id),
+        args=vars(args),
+        backend=args.log_backend,
+        log_dir=args.log_dir,
+        aggregate_every=args.log_aggregate,
+    )
     config = logger.get_config()
 
     # Noise parser
@@ -274,13 +303,14 @@ if __name__ == "__main__":
         action_repeat=config["action_repeat"],
         seed=config["eval_seed"],
         path_render=train_render_model_path if config["eval_render"] else None,
+        offscreen_render=config["offscreen_render"],
         evaluations=config["evaluations"],
         done_reward_threshold=-1000
     )
     Transition = namedtuple(
         "Transition", ("state", "action", "reward", "next_state", "a_logp")
     )
-    buffer = ReplayMemory(
+    buffer = ArrayReplayMemory(
         config["buffer_capacity"],
         config["batch_size"],
         Transition
@@ -351,6 +381,9 @@ if __name__ == "__main__":
         # evaluator=evaluator,
     )
 
+    if config["from_checkpoint"]:
+        trainer.load_training_state(config["from_checkpoint"])
+
     if not args.ommit_training:
         trainer.run()
     else:
@@ -384,6 +417,7 @@ if __name__ == "__main__":
         action_repeat=config["action_repeat"],
         seed=config["eval_seed"],
         path_render=test_render_model_path if config["test_render"] else None,
+        offscreen_render=config["offscreen_render"],
         evaluations=config["test_episodes"],
         done_reward_threshold=-1000,
         noise=add_noise,
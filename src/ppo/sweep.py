@@ -0,0 +1,258 @@
+import os
+import sys
+import json
+import math
+import random
+import argparse
+import itertools
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+from termcolor import colored
+
+
+def load_sweep(path):
+    with open(path, "r") as f:
+        return yaml.safe_load(f)
+
+
+def expand_grid(parameters):
+    """Expand a wandb sweep "parameters" section into a list of configs
+
+    Args:
+        parameters (dict): Parameter specs, each with "value" or "values"
+
+    Returns:
+        list: One dict per grid point, keyed by the command line flag name
+    """
+    names = []
+    choices = []
+    for name, spec in parameters.items():
+        names.append(name)
+        if "values" in spec:
+            choices.append(spec["values"])
+        else:
+            choices.append([spec["value"]])
+    return [dict(zip(names, values)) for values in itertools.product(*choices)]
+
+
+class LocalSweep:
+    def __init__(
+        self,
+        sweep: dict,
+        workers: int = 4,
+        threads: int = 1,
+        out_path: str = "sweep",
+        wandb_mode: str = "offline",
+        extra_args: list = None,
+    ) -> None:
+        self._program = sweep["program"]
+        self._metric = sweep["metric"]["name"]
+        self._maximize = sweep["metric"].get("goal", "maximize") == "maximize"
+        self._workers = workers
+        self._threads = threads
+        self._out_path = out_path
+        self._wandb_mode = wandb_mode
+        self._extra_args = extra_args if extra_args else []
+
+        self.configs = expand_grid(sweep["parameters"])
+        self._results_path = f"{out_path}/results.jsonl"
+        # Run names, hence checkpoints, are unique to the output folder of the sweep
+        self._prefix = os.path.normpath(out_path).strip(os.sep).replace(os.sep, "_").replace(".", "_")
+        self._results = {}
+
+        if not os.path.exists(out_path):
+            os.makedirs(out_path)
+        # Finished (trial, budget) pairs are kept so an interrupted sweep resumes
+        if os.path.exists(self._results_path):
+            with open(self._results_path, "r") as f:
+                for row in f:
+                    result = json.loads(row)
+                    self._results[(result["trial"], result["budget"])] = result["score"]
+
+    def run_name(self, trial, budget=None):
+        """Name of trial, and of its run with budget episodes if given"""
+        name = f"{self._prefix}_{trial:03d}"
+        return name if budget is None else f"{name}_{budget}"
+
+    def checkpoint_path(self, trial, budget):
+        """Checkpoint written by the training program for the run of trial with budget episodes"""
+        return f"param/checkpoint_{self.run_name(trial, budget)}.pkl"
+
+    def resume_budget(self, trial, budget):
+        """Largest budget below budget trial was already run with, None if there is none
+
+        Every run writes its own checkpoint, so a trial sampled by several hyperband
+        brackets never resumes from a run longer than the one it continues.
+        """
+        budgets = [b for t, b in self._results if t == trial and b < budget]
+        return max(budgets) if budgets else None
+
+    def command(self, trial, budget):
+        cmd = [
+            sys.executable,
+            self._program,
+            "--run-name",
+            self.run_name(trial, budget),
+            "--episodes",
+            str(budget),
+            "--results-file",
+            f"{self._out_path}/sweep_{trial:03d}_{budget}.json",
+        ]
+        for name, value in self.configs[trial].items():
+            cmd += [f"--{name}", str(value)]
+        # Promoted trials continue from the checkpoint of their previous rung in this sweep
+        previous = self.resume_budget(trial, budget)
+        if previous is not None and os.path.exists(self.checkpoint_path(trial, previous)):
+            cmd += ["--from-checkpoint", self.checkpoint_path(trial, previous)]
+        return cmd + self._extra_args
+
+    def run_trial(self, trial, budget):
+        if (trial, budget) in self._results:
+            return self._results[(trial, budget)]
+
+        env = dict(os.environ)
+        env["WANDB_MODE"] = self._wandb_mode
+        env["WANDB_SILENT"] = "true"
+        # Avoid oversubscribing the machine with one BLAS pool per trial
+        env["OMP_NUM_THREADS"] = str(self._threads)
+        env["MKL_NUM_THREADS"] = str(self._threads)
+
+        log_file = f"{self._out_path}/sweep_{trial:03d}_{budget}.log"
+        with open(log_file, "w") as log:
+            process = subprocess.run(
+                self.command(trial, budget), stdout=log, stderr=subprocess.STDOUT, env=env
+            )
+
+        score = -math.inf
+        results_file = f"{self._out_path}/sweep_{trial:03d}_{budget}.json"
+        if process.returncode == 0 and os.path.exists(results_file):
+            with open(results_file, "r") as f:
+                score = json.load(f)[self._metric]
+            if not self._maximize:
+                score = -score
+        else:
+            print(colored(f"Trial {trial} failed, see {log_file}", "red"))
+
+        self._results[(trial, budget)] = score
+        with open(self._results_path, "a+") as f:
+            f.write(json.dumps({"trial": trial, "budget": budget, "score": score, "config": self.configs[trial]}) + "\n")
+        return score
+
+    def run_rung(self, trials, budget):
+        print(colored(f"Running {len(trials)} trials for {budget} episodes", "blue"))
+        with ThreadPoolExecutor(max_workers=self._workers) as pool:
+            scores = list(pool.map(lambda trial: self.run_trial(trial, budget), trials))
+        return dict(zip(trials, scores))
+
+    def successive_halving(self, trials, min_budget, max_budget, eta=3):
+        """Run trials with a growing episode budget, keeping the best 1/eta each rung
+
+        Returns:
+            dict: Score of every trial at the last budget it was run with
+        """
+        scores = {}
+        budget = min_budget
+        while True:
+            rung = self.run_rung(trials, budget)
+            scores.update(rung)
+            if budget >= max_budget or len(trials) <= 1:
+                return scores
+            keep = max(1, len(trials) // eta)
+            trials = sorted(trials, key=lambda trial: rung[trial], reverse=True)[:keep]
+            budget = min(max_budget, budget * eta)
+
+    def hyperband(self, min_budget, max_budget, eta=3, seed=0):
+        """Hyperband brackets of successive halving
+
+        Every bracket samples its n_i configurations from the full grid, so a
+        configuration may be tried by several brackets. Grids larger than the
+        brackets are only partly explored, the number of configurations run is printed.
+
+        Returns:
+            set: Trials run by at least one bracket
+        """
+        s_max = int(math.log(max_budget / min_budget, eta) + 1e-9)
+        rng = random.Random(seed)
+        explored = set()
+
+        for s in range(s_max, -1, -1):
+            nb_trials = min(len(self.configs), int(math.ceil((s_max + 1) / (s + 1) * eta ** s)))
+            bracket = rng.sample(range(len(self.configs)), nb_trials)
+            explored.update(bracket)
+            budget = max(min_budget, int(max_budget * eta ** -s))
+            print(colored(f"Bracket {s_max - s}: {nb_trials} configurations from {budget} episodes", "blue"))
+            self.successive_halving(bracket, budget, max_budget, eta=eta)
+
+        print(colored(f"Hyperband explored {len(explored)} of {len(self.configs)} configurations", "magenta"))
+        return explored
+
+    def report(self, top=10):
+        """Print the best trials, ranking trials that reached a larger budget first"""
+        reached = {}
+        for (trial, budget), score in self._results.items():
+            if trial not in reached or budget > reached[trial][0]:
+                reached[trial] = (budget, score)
+        best = sorted(reached.items(), key=lambda item: item[1], reverse=True)[:top]
+        for trial, (budget, score) in best:
+            if not self._maximize:
+                score = -score
+            print(colored(f"{self.run_name(trial)} ({budget} episodes) {self._metric}: {score:.2f} {self.configs[trial]}", "cyan"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run a wandb sweep file locally with successive halving",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "-C", "--config", type=str, default="sweep.yaml", help="Sweep yaml file"
+    )
+    parser.add_argument(
+        "-M",
+        "--method",
+        type=str,
+        default="halving",
+        help='Pruning method: "halving" or "hyperband"',
+    )
+    parser.add_argument(
+        "-W", "--workers", type=int, default=4, help="Number of trials run in parallel"
+    )
+    parser.add_argument(
+        "-T", "--threads", type=int, default=1, help="OpenMP and MKL threads for each trial"
+    )
+    parser.add_argument(
+        "-MiB", "--min-budget", type=int, default=100, help="Episodes of the first rung"
+    )
+    parser.add_argument(
+        "-MaB", "--max-budget", type=int, default=2700, help="Episodes of the last rung"
+    )
+    parser.add_argument(
+        "-ETA", "--eta", type=int, default=3, help="Keep 1/eta trials and multiply the budget by eta each rung"
+    )
+    parser.add_argument(
+        "-O", "--out-path", type=str, default="sweep", help="Folder for trial logs and results"
+    )
+    parser.add_argument(
+        "-WM", "--wandb-mode", type=str, default="offline", help="WANDB_MODE of each trial"
+    )
+    args, extra_args = parser.parse_known_args()
+
+    sweep = LocalSweep(
+        load_sweep(args.config),
+        workers=args.workers,
+        threads=args.threads,
+        out_path=args.out_path,
+        wandb_mode=args.wandb_mode,
+        extra_args=extra_args,
+    )
+    print(colored(f"Sweep over {len(sweep.configs)} configurations", "magenta"))
+
+    if args.method == "hyperband":
+        sweep.hyperband(args.min_budget, args.max_budget, eta=args.eta)
+    else:
+        sweep.successive_halving(
+            list(range(len(sweep.configs))), args.min_budget, args.max_budget, eta=args.eta
+        )
+    sweep.report()
@@ -1,21 +1,22 @@
 import os
+import json
 import argparse
 import torch
 import uuid
 import glob
 from termcolor import colored
-from pyvirtualdisplay import Display
 from collections import namedtuple
 
 import sys
 sys.path.append('..')
 from shared.utils.utils import init_uncert_file
 from shared.components.env import Env
-from shared.utils.replay_buffer import ReplayMemory
+from shared.utils.replay_buffer import ArrayReplayMemory
 from shared.components.logger import Logger
 from components.uncert_agents import make_agent
 from models import make_model
 from components.trainer import Trainer
+from components.actor_learner import ActorLearnerTrainer
 
 
 if __name__ == "__main__":
@@ -132,12 +133,59 @@ if __name__ == "__main__":
         action="store_true",
         help="render the environment on evaluation",
     )
+    train_config.add_argument(
+        "-OR",
+        "--offscreen-render",
+        action="store_true",
+        help="record rendered episodes offscreen with ffmpeg instead of starting a virtual display",
+    )
     train_config.add_argument(
         "-DB",
         "--debug",
         action="store_true",
         help="debug mode",
     )
+    train_config.add_argument(
+        "-AC",
+        "--actors",
+        type=int,
+        default=0,
+        help="Number of actor processes collecting rollouts while the learner updates, 0 to train synchronously",
+    )
+    train_config.add_argument(
+        "-RN",
+        "--run-name",
+        type=str,
+        default=None,
+        help="Name used for checkpoints and uncertainty files, defaults to the model name",
+    )
+    train_config.add_argument(
+        "-RF",
+        "--results-file",
+        type=str,
+        default=None,
+        help="Write the final training metrics to this json file",
+    )
+
+    # Logging
+    log_config = parser.add_argument_group("Log config")
+    log_config.add_argument(
+        "-LB",
+        "--log-backend",
+        type=str,
+        default="wandb",
+        help='Where metrics are sent: "wandb" or "offline" to write a jsonl file',
+    )
+    log_config.add_argument(
+        "-LD", "--log-dir", type=str, default="logs", help="Folder of the offline logs"
+    )
+    log_config.add_argument(
+        "-LA",
+        "--log-aggregate",
+        type=int,
+        default=1,
+        help="Average loss metrics over this many updates before logging them",
+    )
 
     # Update
     update_config = parser.add_argument_group("Update config")
@@ -155,14 +203,14 @@ if __name__ == "__main__":
     
     run_id = uuid.uuid4()
     # run_name = f"{args.model}_{run_id}"
-    run_name = args.model
+    run_name = args.run_name if args.run_name else args.model
     render_path = "render"
     render_model_path = f"{render_path}/train"
     train_render_model_path = f"{render_model_path}/{run_name}"
     param_path = "param"
     uncertainties_path = "uncertainties"
     uncertainties_train_path = f"{uncertainties_path}/eval"
-    uncertainties_file_path = f"{uncertainties_train_path}/{run_name}.txt"
+    uncertainties_file_path = f"{uncertainties_train_path}/{run_name}.trace"
 
     print(colored("Initializing data folders", "blue"))
     # Init model checkpoint folder and uncertainties folder
@@ -177,19 +225,17 @@ if __name__ == "__main__":
             os.makedirs(render_model_path)
         if not os.path.exists(train_render_model_path):
             os.makedirs(train_render_model_path)
-        else:
+        elif not args.from_checkpoint:
             files = glob.glob(f"{train_render_model_path}/*")
             for f in files:
                 os.remove(f)
         if not os.path.exists(uncertainties_train_path):
             os.makedirs(uncertainties_train_path)
-        init_uncert_file(file=uncertainties_file_path)
+        # A resumed run keeps appending to its eval trace
+        if not args.from_checkpoint or not os.path.exists(uncertainties_file_path):
+            init_uncert_file(file=uncertainties_file_path)
     print(colored("Data folders created successfully", "green"))
 
-    # Virtual display
-    display = Display(visible=0, size=(1400, 900))
-    display.start()
-
     # Whether to use cuda or cpu
     if args.device == "auto":
         torch.cuda.empty_cache()
@@ -203,7 +249,16 @@ if __name__ == "__main__":
     print(colored(f"Using: {device}", "green"))
 
     # Init logger
-    logger = Logger("inv-pendulum-ppo", args.model, run_name, str(run_id), args=vars(args))
+    logger = Logger(
+        "inv-pendulum-ppo",
+        args.model,
+        run_name,
+        str(run_id),
+        args=vars(args),
+        backend=args.log_backend,
+        log_dir=args.log_dir,
+        aggregate_every=args.log_aggregate,
+    )
     config = logger.get_config()
 
     # Noise parser
@@ -226,13 +281,14 @@ if __name__ == "__main__":
         action_repeat=config["action_repeat"],
         seed=config["eval_seed"],
         path_render=train_render_model_path if config["eval_render"] else None,
+        offscreen_render=config["offscreen_render"],
         evaluations=config["evaluations"],
         done_reward_threshold=-1000
     )
     Transition = namedtuple(
         "Transition", ("state", "action", "reward", "next_state", "a_logp")
     )
-    buffer = ReplayMemory(
+    buffer = ArrayReplayMemory(
         config["buffer_capacity"],
         config["batch_size"],
         Transition
@@ -280,12 +336,7 @@ if __name__ == "__main__":
     for name, param in config.items():
         print(colored(f"{name}: {param}", "cyan"))
 
-    trainer = Trainer(
-        agent,
-        env,
-        eval_env,
-        logger,
-        config["episodes"],
+    trainer_kwargs = dict(
         init_ep=init_epoch,
         nb_evaluations=config["evaluations"],
         eval_interval=config["eval_interval"],
@@ -293,7 +344,56 @@ if __name__ == "__main__":
         checkpoint_every=10,
         debug=config["debug"],
     )
+    if config["actors"] > 0:
+        trainer = ActorLearnerTrainer(
+            agent,
+            eval_env,
+            logger,
+            config["episodes"],
+            env_kwargs=dict(
+                state_stack=config["state_stack"],
+                action_repeat=config["action_repeat"],
+                seed=config["train_seed"],
+                noise=add_noise,
+                done_reward_threshold=-1000,
+            ),
+            model_kwargs=dict(
+                model=config["model"],
+                state_stack=config["state_stack"],
+                input_dim=env.observation_dims,
+                output_dim=env.action_dims,
+                architecture=architecture,
+            ),
+            agent_kwargs=dict(
+                gamma=config["gamma"],
+                batch_size=config["batch_size"],
+                lr=config["learning_rate"],
+                nb_nets=config["nb_nets"],
+                ppo_epoch=config["ppo_epoch"],
+                clip_param=config["clip_param"],
+            ),
+            nb_actors=config["actors"],
+            **trainer_kwargs,
+        )
+    else:
+        trainer = Trainer(
+            agent,
+            env,
+            eval_env,
+            logger,
+            config["episodes"],
+            **trainer_kwargs,
+        )
+
+    if config["from_checkpoint"]:
+        trainer.load_training_state(config["from_checkpoint"])
 
     trainer.run()
     env.close()
-    eval_env.close()
\ No newline at end of file
+    eval_env.close()
+
+    if args.results_file:
+        with open(args.results_file, "w") as f:
+            json.dump(
+                {"Max Episode Running Score": trainer.get_max_running_score()}, f
+            )
\ No newline at end of file
@@ -0,0 +1,135 @@
+import os
+import atexit
+import queue
+import shutil
+import weakref
+import itertools
+import threading
+import torch
+
+
+def snapshot(obj):
+    """Copy every tensor of a nested state dict into new CPU memory
+
+    Args:
+        obj: Tensor, or dict, list or tuple containing tensors
+
+    Returns:
+        Same structure, safe to serialize while training keeps modifying the originals
+    """
+    if torch.is_tensor(obj):
+        return torch.empty_like(obj, device="cpu").copy_(obj.detach())
+    if isinstance(obj, dict):
+        return {key: snapshot(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot(value) for value in obj)
+    return obj
+
+
+class Checkpointer:
+    def __init__(self) -> None:
+        """Writes checkpoints on a background thread
+
+        The state is copied to CPU when save is called, then serialized to a
+        temporary file and renamed over the target, so a checkpoint file is never
+        left half written. Saves from the same owner that share a key while the
+        first one is still queued or being written are serialized only once.
+        """
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._owners = weakref.WeakKeyDictionary()
+        self._owner_ids = itertools.count()
+        self._pending = {}
+        self._written = None
+        self._error = None
+
+        self._thread = threading.Thread(target=self._work, daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def save(self, obj, path, key=None, dump=torch.save, owner=None):
+        """Queue obj to be written to path
+
+        Args:
+            obj: Object to save, usually a dict of state dicts
+            path (str): Destination file
+            key (optional): Identifies the saved state, e.g. (epoch, update step).
+                A save with the owner and key of a queued or last written checkpoint reuses it.
+            dump (callable, optional): Writes obj to an open file. Defaults to torch.save.
+            owner (optional): Object the state belongs to, e.g. the agent, so that
+                agents sharing the checkpointer never reuse each other's saves. Keys
+                are only scoped when given.
+        """
+        self._raise()
+        with self._lock:
+            if key is not None and owner is not None:
+                if owner not in self._owners:
+                    self._owners[owner] = next(self._owner_ids)
+                key = (self._owners[owner], key)
+            if key is not None and key in self._pending:
+                self._pending[key]["paths"].append(path)
+                return
+            if key is not None and self._written is not None and self._written[0] == key:
+                job = {"source": self._written[1], "paths": [path], "key": key}
+            else:
+                job = {"obj": snapshot(obj), "dump": dump, "paths": [path], "key": key}
+            if key is not None:
+                self._pending[key] = job
+        self._queue.put(job)
+
+    def flush(self):
+        """Block until every queued checkpoint is on disk"""
+        self._queue.join()
+        self._raise()
+
+    def _raise(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                source = job["source"] if "source" in job else job["paths"][0]
+                with self._lock:
+                    self._pending.pop(job["key"], None)
+                    paths = list(job["paths"])
+                    # Jobs queued from now on run after this one, so they can copy its file
+                    self._written = (job["key"], source) if job["key"] is not None else None
+                if "obj" in job:
+                    self._write(job["obj"], source, job["dump"])
+                for path in paths:
+                    self._copy(source, path)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    @staticmethod
+    def _write(obj, path, dump):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            dump(obj, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _copy(source, path):
+        if os.path.abspath(source) == os.path.abspath(path):
+            return
+        tmp_path = f"{path}.tmp"
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, path)
+
+
+_checkpointer = None
+
+
+def get_checkpointer():
+    """Process wide checkpointer, so loading a file waits for writes queued by any agent"""
+    global _checkpointer
+    if _checkpointer is None:
+        _checkpointer = Checkpointer()
+    return _checkpointer
@@ -0,0 +1,89 @@
+import atexit
+import queue
+import threading
+import subprocess
+
+_display = None
+_recorders = set()
+
+
+def ensure_display(size=(1400, 900)):
+    """Start the virtual X display the first time something needs to render on screen
+
+    Returns:
+        Display: The process wide pyvirtualdisplay display
+    """
+    global _display
+    if _display is None:
+        from pyvirtualdisplay import Display
+
+        _display = Display(visible=0, size=size)
+        _display.start()
+        atexit.register(_display.stop)
+    return _display
+
+
+class VideoRecorder:
+    def __init__(self, path: str, fps: int = 30, max_frames: int = 256) -> None:
+        """Encodes rgb frames to a video with ffmpeg from a background thread
+
+        ffmpeg is started with the first frame, when the frame size is known.
+
+        Args:
+            path (str): Output video, the container is taken from its extension
+            fps (int, optional): Frames per second. Defaults to 30.
+            max_frames (int, optional): Frames queued before write blocks. Defaults to 256.
+        """
+        self.path = path
+        self._fps = fps
+        self._frames = queue.Queue(maxsize=max_frames)
+        self._process = None
+        self._thread = None
+
+    def write(self, frame):
+        """Queue a (height, width, 3) uint8 frame"""
+        if self._thread is None:
+            self._start(frame.shape)
+        self._frames.put(frame.copy())
+
+    def _start(self, shape):
+        height, width = shape[:2]
+        self._process = subprocess.Popen(
+            [
+                "ffmpeg", "-y", "-loglevel", "error",
+                "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(self._fps), "-i", "-",
+                "-pix_fmt", "yuv420p", "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", self.path,
+            ],
+            stdin=subprocess.PIPE,
+        )
+        self._thread = threading.Thread(target=self._work, name=f"VideoRecorder-{self.path}", daemon=True)
+        self._thread.start()
+        _recorders.add(self)
+
+    def _work(self):
+        while True:
+            frame = self._frames.get()
+            if frame is None:
+                break
+            self._process.stdin.write(frame.tobytes())
+        self._process.stdin.close()
+        self._process.wait()
+
+    def close(self, wait=False):
+        """Finish the video, the queued frames keep being encoded in the background unless wait is set"""
+        if self._thread is None:
+            return
+        if self in _recorders:
+            self._frames.put(None)
+            _recorders.discard(self)
+        if wait:
+            self._thread.join()
+
+
+@atexit.register
+def _finish_recorders():
+    # Videos still open or encoding when the run ends are completed before exiting
+    for recorder in list(_recorders):
+        recorder.close()
+    for thread in [t for t in threading.enumerate() if t.name.startswith("VideoRecorder")]:
+        thread.join()
@@ -1,11 +1,10 @@
 import numpy as np
-from gym.wrappers import Monitor
-import gym
 from collections import deque
 
 import sys
 sys.path.append('../..')
 from shared.utils.noise import generate_noise_variance, add_noise
+from shared.components.display import VideoRecorder, ensure_display
 
 
 class Env():
@@ -13,13 +12,23 @@ class Env():
     Environment wrapper for InvertedPendulum-v4 
     """
 
-    def __init__(self, state_stack: int, action_repeat: int, seed: float=0, path_render: str=None, evaluations: int=1, noise=None, done_reward_threshold: float=-0.1, done_reward: float=0):
+    def __init__(self, state_stack: int, action_repeat: int, seed: float=0, path_render: str=None, evaluations: int=1, noise=None, done_reward_threshold: float=-0.1, done_reward: float=0, offscreen_render: bool=False):
+        import gym
+        from gym.wrappers import Monitor
+
         self.render_path = path_render is not None
-        if not self.render_path:
+        self.offscreen_render = self.render_path and offscreen_render
+        self.evaluations = evaluations
+        self.idx_val = evaluations // 2
+        self._path_render = path_render
+        self._episode_id = -1
+        self._recorder = None
+        if not self.render_path or self.offscreen_render:
+            # Offscreen frames come from env.render("rgb_array"), which needs no X server
+            # with a headless GL backend such as MUJOCO_GL=egl
             self.env = gym.make('InvertedPendulum-v2')
         else:
-            self.evaluations = evaluations
-            self.idx_val = evaluations // 2
+            ensure_display()
             self.env = Monitor(gym.make('InvertedPendulum-v2'), path_render,
                                video_callable=lambda episode_id: episode_id % evaluations == self.idx_val, force=True)
         self.env.seed(seed)
@@ -48,6 +57,9 @@ class Env():
                 self.set_noise_value(noise)
     
     def close(self):
+        if self._recorder is not None:
+            self._recorder.close()
+            self._recorder = None
         self.env.close()
     
     def set_noise_range(self, noise):
@@ -67,6 +79,8 @@ class Env():
         self.reward_memory.clear()
         self.die = False
         state = self.env.reset()
+        if self.offscreen_render:
+            self._record_episode()
 
         if self.use_noise:
             if self.generate_noise:
@@ -83,6 +97,8 @@ class Env():
         total_steps = 0
         for _ in range(self.action_repeat):
             state, reward, die, info = self.env.step(action)
+            if self._recorder is not None:
+                self._recorder.write(self.env.render(mode="rgb_array"))
             # if no reward recently, end the episode
             done = False
             done_reward = 0
@@ -106,6 +122,32 @@ class Env():
         assert len(self.state_stack) == self.state_stack.maxlen
         return np.array(self.state_stack), total_reward, done, die, info
 
+    def _record_episode(self):
+        if self._recorder is not None:
+            self._recorder.close()
+            self._recorder = None
+        self._episode_id += 1
+        if self._episode_id % self.evaluations == self.idx_val:
+            self._recorder = VideoRecorder(
+                f"{self._path_render}/episode{self._episode_id:06d}.mp4",
+                fps=self.env.metadata.get("video.frames_per_second", 30),
+            )
+            self._recorder.write(self.env.render(mode="rgb_array"))
+
+    def get_rng_state(self):
+        # Newer gym seeds a np.random.Generator, older gym a legacy RandomState
+        rng = self.env.np_random
+        if hasattr(rng, "bit_generator"):
+            return rng.bit_generator.state
+        return rng.get_state()
+
+    def set_rng_state(self, state):
+        rng = self.env.np_random
+        if hasattr(rng, "bit_generator"):
+            rng.bit_generator.state = state
+        else:
+            rng.set_state(state)
+
     def render(self, *arg):
         return self.env.render(*arg)
 
@@ -38,7 +38,7 @@ class Evaluator:
 
         if not os.path.exists(base_path):
             os.makedirs(base_path)
-        init_uncert_file(file=f"{self.base_path}/{self.model_name}.txt")
+        init_uncert_file(file=f"{self.base_path}/{self.model_name}.trace")
     
     def load_env(self):
         self._eval_env = Env(
@@ -91,7 +91,7 @@ class Evaluator:
                 i_val,
                 score,
                 uncert,
-                file=f"{self.base_path}/{self.model_name}.txt",
+                file=f"{self.base_path}/{self.model_name}.trace",
                 sigma=self._eval_env.random_noise,
             )
 
@@ -1,15 +1,153 @@
-import wandb
+import os
+import json
+import time
+import atexit
+import threading
+
+
+def is_high_frequency(key):
+    """Metrics logged on every update step, e.g. "Loss 1" or "Action Loss" """
+    return "Loss" in key
+
 
 class Logger(object):
 
-    def __init__(self, project_name, group, model_name, run_id, args: None):
-        wandb.init(project=project_name, group=group, name=model_name, id=run_id, config=args)
+    def __init__(
+        self,
+        project_name,
+        group,
+        model_name,
+        run_id,
+        args: None,
+        backend="wandb",
+        log_dir="logs",
+        aggregate_every=1,
+        flush_interval=5.0,
+        max_buffered=1000,
+    ):
+        """Buffered metrics logger, rows are written in batches by a background thread
+
+        Args:
+            project_name (str): Wandb project
+            group (str): Wandb group
+            model_name (str): Run name, also the name of the offline log file
+            run_id (str): Wandb run id
+            args (dict): Run config
+            backend (str, optional): "wandb" or "offline", which writes a jsonl file to log_dir. Defaults to "wandb".
+            log_dir (str, optional): Folder of the offline logs. Defaults to "logs".
+            aggregate_every (int, optional): Average high frequency metrics over this many log calls. Defaults to 1.
+            flush_interval (float, optional): Seconds between background flushes. Defaults to 5.0.
+            max_buffered (int, optional): Rows buffered before an early flush. Defaults to 1000.
+        """
+        self._backend = backend
+        self._config = dict(args) if args else {}
+        self._aggregate_every = aggregate_every
+        self._flush_interval = flush_interval
+        self._max_buffered = max_buffered
+
+        self._rows = []
+        self._sums = {}
+        self._counts = {}
+        self._last = {}
+        self._nb_aggregated = 0
+        self._step = 0
+
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+
+        if backend == "wandb":
+            import wandb
+            self._wandb = wandb
+            wandb.init(project=project_name, group=group, name=model_name, id=run_id, config=args)
+        elif backend == "offline":
+            if not os.path.exists(log_dir):
+                os.makedirs(log_dir)
+            with open(f"{log_dir}/{model_name}_config.json", "w") as f:
+                json.dump({"project": project_name, "group": group, "id": run_id, "config": self._config}, f, default=str)
+            self._file = open(f"{log_dir}/{model_name}.jsonl", "a")
+        else:
+            raise ValueError(f"Unknown logger backend: {backend}")
+
+        self._thread = threading.Thread(target=self._work, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
 
     def get_config(self):
-        return wandb.config
+        if self._backend == "wandb":
+            return self._wandb.config
+        return self._config
 
     def watch(self, model):
-        wandb.watch(model)
-    
+        if self._backend == "wandb":
+            self._wandb.watch(model)
+
     def log(self, to_log: dict):
-        wandb.log(to_log)
\ No newline at end of file
+        if self._aggregate_every > 1 and any(is_high_frequency(key) for key in to_log):
+            self._aggregate(to_log)
+        else:
+            self._push(dict(to_log))
+
+    def _aggregate(self, to_log):
+        for key, value in to_log.items():
+            if is_high_frequency(key):
+                self._sums[key] = self._sums.get(key, 0) + value
+                self._counts[key] = self._counts.get(key, 0) + 1
+            else:
+                self._last[key] = value
+        self._nb_aggregated += 1
+        if self._nb_aggregated >= self._aggregate_every:
+            self._push_aggregated()
+
+    def _push_aggregated(self):
+        if self._nb_aggregated == 0:
+            return
+        row = dict(self._last)
+        for key, total in self._sums.items():
+            row[key] = total / self._counts[key]
+        self._sums, self._counts, self._last = {}, {}, {}
+        self._nb_aggregated = 0
+        self._push(row)
+
+    def _push(self, row):
+        with self._lock:
+            self._rows.append((row, time.time()))
+            nb_rows = len(self._rows)
+        if nb_rows >= self._max_buffered:
+            self._wake.set()
+
+    def flush(self):
+        """Write every buffered row"""
+        with self._lock:
+            rows, self._rows = self._rows, []
+        if not rows:
+            return
+        with self._write_lock:
+            if self._backend == "wandb":
+                for row, _ in rows:
+                    self._wandb.log(row)
+            else:
+                lines = []
+                for row, timestamp in rows:
+                    lines.append(json.dumps(dict(row, _step=self._step, _time=timestamp)))
+                    self._step += 1
+                self._file.write("\n".join(lines) + "\n")
+                self._file.flush()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._push_aggregated()
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+        if self._backend == "offline":
+            self._file.close()
+
+    def _work(self):
+        while not self._closed:
+            self._wake.wait(self._flush_interval)
+            self._wake.clear()
+            self.flush()
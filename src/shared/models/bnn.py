@@ -1,6 +1,30 @@
+import torch
 import torch.nn as nn
+import torch.nn.functional as F
 import torchbnn as bnn
 
+
+def local_reparameterization(layer: bnn.BayesLinear, x):
+    """Output of a BayesLinear with independent weights for every row of x
+
+    The pre-activations are sampled from their gaussian instead of the weights,
+    so a batch of copies of the same input gives independent samples of the network.
+    """
+    mean = F.linear(x, layer.weight_mu, layer.bias_mu if layer.bias else None)
+    var = F.linear(
+        x ** 2,
+        torch.exp(2 * layer.weight_log_sigma),
+        torch.exp(2 * layer.bias_log_sigma) if layer.bias else None,
+    )
+    return mean + torch.sqrt(var) * torch.randn_like(mean)
+
+
+def sample_forward(modules, x):
+    """Apply modules in order, sampling the BayesLinear layers per row"""
+    for module in modules:
+        x = local_reparameterization(module, x) if isinstance(module, bnn.BayesLinear) else module(x)
+    return x
+
 class BNNBase(nn.Module):
     def __init__(self, state_stack, input_dim, architecture=[256, 128, 64]):
         super(BNNBase, self).__init__()
@@ -0,0 +1,77 @@
+import torch
+import torch.nn as nn
+
+
+def _storage(t):
+    return t.untyped_storage() if hasattr(t, "untyped_storage") else t.storage()
+
+
+def flat_view(tensors):
+    """1D view over tensors laid out back to back in one storage, None if they are not
+
+    The weights of networks packed by a ParameterArena are copied with a single copy_
+    through this view instead of one copy per tensor.
+    """
+    if not tensors:
+        return None
+    first = tensors[0]
+    expected = first.data_ptr()
+    for t in tensors:
+        if (
+            t.data_ptr() != expected
+            or t.dtype != first.dtype
+            or t.device != first.device
+            or _storage(t).data_ptr() != _storage(first).data_ptr()
+            or not t.is_contiguous()
+        ):
+            return None
+        expected += t.numel() * t.element_size()
+    offset = first.storage_offset()
+    numel = sum(t.numel() for t in tensors)
+    return first.new_empty(0).set_(_storage(first), offset, (numel,))
+
+
+class ParameterArena:
+    def __init__(self, modules: "list") -> None:
+        """Contiguous storage of the parameters and gradients of a set of networks
+
+        Every parameter becomes a view of one flat weight buffer and its gradient a view
+        of one flat gradient buffer, so optimizer steps, gradient clipping and weight
+        copies run as single ops over all the networks. Optimize param and clear the
+        gradients with zero_grad: setting them to None would detach them from the arena.
+
+        Args:
+            modules (list): Networks to pack, on the same device and dtype
+        """
+        params = []
+        for module in modules:
+            for param in module.parameters():
+                if all(param is not p for p in params):
+                    params.append(param)
+        assert len({(p.dtype, p.device) for p in params}) == 1, "arena parameters must share dtype and device"
+
+        numel = sum(p.numel() for p in params)
+        self.data = torch.zeros(numel, dtype=params[0].dtype, device=params[0].device)
+        self.grad = torch.zeros_like(self.data)
+
+        offset = 0
+        for param in params:
+            size = param.numel()
+            self.data[offset : offset + size].copy_(param.data.reshape(-1))
+            param.data = self.data[offset : offset + size].view_as(param)
+            param.grad = self.grad[offset : offset + size].view_as(param)
+            offset += size
+        self._params = params
+
+        # Single leaf the optimizer steps, sharing the storage of the views
+        self.param = nn.Parameter(self.data)
+        self.param.grad = self.grad
+
+    def parameters(self):
+        return self._params
+
+    def zero_grad(self):
+        self.grad.zero_()
+
+    def clamp_grad_(self, min, max):
+        self.grad.clamp_(min, max)
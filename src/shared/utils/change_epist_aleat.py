@@ -1,23 +1,182 @@
+import os
+import re
+import sys
+import argparse
+import operator
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 
-def change_uncerts(path, fix_path):
-    with open(path, "r") as f:
-        with open(fix_path, "a+") as fix_f:
-            for row in f:
-                data = np.array(row[:-1].split(",")).astype(np.float32)
-                epoch = data[0]
-                val_idx = data[1]
-                reward = data[2]
-                sigma = data[3]
-                l = len(data) - 4
-                epist = data[4 : l // 2 + 4]
-                aleat = data[l // 2 + 4 :]
-
-                np.savetxt(fix_f, np.concatenate(([epoch], [val_idx], [reward], [sigma], aleat, epist)).reshape(1, -1), delimiter=',')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from shared.utils.trace import append_episodes, init_trace, iter_episodes, replace_trace
+
+UNCERT_COLUMNS = ("epist", "aleat")
+HEADER_COLUMNS = ("epoch", "val_idx", "score", "sigma")
+_OPERATORS = {
+    "<=": operator.le,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    ">": operator.gt,
+}
+
+
+def parse_filter(text):
+    """Parse an episode filter such as "epoch>=100" or "sigma<0.5" """
+    match = re.fullmatch(r"\s*(\w+)\s*(<=|>=|==|!=|<|>)\s*(\S+)\s*", text)
+    if match is None or match.group(1) not in HEADER_COLUMNS:
+        raise argparse.ArgumentTypeError(f"Invalid filter: {text}")
+    return match.group(1), match.group(2), float(match.group(3))
+
+
+def transform(headers, payload, columns=None, scale=None, filters=None):
+    """Apply a column remap, scaling and episode filters to a chunk of episodes
+
+    Args:
+        headers (np.ndarray): INDEX_DTYPE records, offsets relative to payload
+        payload (np.ndarray): float32 epist then aleat values of every episode
+        columns (dict, optional): Output uncertainty column -> input column, e.g.
+            {"epist": "aleat", "aleat": "epist"} to swap them. Defaults to None.
+        scale (dict, optional): Column -> factor, for uncertainty columns, score or sigma. Defaults to None.
+        filters (list, optional): (column, operator, value) episodes must satisfy. Defaults to None.
+
+    Returns:
+        tuple: Headers and packed payload of the kept episodes
+    """
+    columns = columns if columns else {}
+    scale = scale if scale else {}
+
+    keep = np.ones(headers.shape[0], dtype=bool)
+    for column, op, value in filters if filters else []:
+        keep &= _OPERATORS[op](headers[column], value)
+    headers = headers[keep].copy()
+
+    lengths = headers["length"].astype(np.int64)
+    starts = np.zeros(lengths.shape[0], dtype=np.int64)
+    np.cumsum(2 * lengths[:-1], out=starts[1:])
+    steps = np.arange(int(lengths.sum())) - np.repeat(starts // 2, lengths)
+    source = {
+        "epist": np.repeat(headers["offset"] // 4, lengths) + steps,
+        "aleat": np.repeat(headers["offset"] // 4 + lengths, lengths) + steps,
+    }
+    target = {
+        "epist": np.repeat(starts, lengths) + steps,
+        "aleat": np.repeat(starts + lengths, lengths) + steps,
+    }
+    out = np.empty(2 * int(lengths.sum()), dtype=np.float32)
+    for column in UNCERT_COLUMNS:
+        values = payload[source[columns.get(column, column)]]
+        if column in scale:
+            values = values * np.float32(scale[column])
+        out[target[column]] = values
+
+    for column in ("score", "sigma"):
+        if column in scale:
+            headers[column] *= scale[column]
+    headers["offset"] = 4 * starts
+    return headers, out
+
+
+def transform_file(path, out_path=None, chunk_episodes=1000, **kwargs):
+    """Stream a trace or legacy text file through transform into a trace
+
+    Memory is bounded by chunk_episodes. The output is written next to its target
+    and renamed over it at the end, so it can replace path in place and a rerun
+    rewrites the output instead of appending to it.
+
+    Args:
+        path (str): Trace or legacy .txt file
+        out_path (str, optional): Output trace. Defaults to path for traces and to
+            the .trace next to a legacy file.
+
+    Returns:
+        str: Output trace
+    """
+    if out_path is None:
+        out_path = f"{os.path.splitext(path)[0]}.trace" if path.endswith(".txt") else path
+    tmp_path = f"{out_path}.tmp"
+    init_trace(tmp_path)
+    for headers, payload in iter_episodes(path, chunk_episodes=chunk_episodes):
+        headers, payload = transform(headers, payload, **kwargs)
+        if headers.shape[0]:
+            append_episodes(tmp_path, headers, payload)
+    replace_trace(tmp_path, out_path)
+    return out_path
+
+
+def change_uncerts(path, fix_path=None):
+    """Swap the epistemic and aleatoric columns of a trace"""
+    return transform_file(path, out_path=fix_path, columns={"epist": "aleat", "aleat": "epist"})
+
+
+def _assignments(text, cast):
+    pairs = dict(item.split("=") for item in text.split(",")) if text else {}
+    return {key.strip(): cast(value) for key, value in pairs.items()}
+
 
 if __name__ == "__main__":
-    file = 'uncertainties/train/base.txt'
-    fix_file = 'uncertainties/train/fix_base.txt'
-    
-    change_uncerts(file, fix_file)
+    parser = argparse.ArgumentParser(
+        description="Remap, scale and filter the columns of uncertainty traces",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("paths", nargs="+", help="Traces or legacy .txt files")
+    parser.add_argument(
+        "-S", "--swap", action="store_true", help="Swap the epistemic and aleatoric columns"
+    )
+    parser.add_argument(
+        "-M",
+        "--map",
+        type=str,
+        default=None,
+        help='Output column from input column, e.g. "epist=aleat,aleat=epist"',
+    )
+    parser.add_argument(
+        "-SC", "--scale", type=str, default=None, help='Column factors, e.g. "epist=0.5,score=0.1"'
+    )
+    parser.add_argument(
+        "-F",
+        "--filter",
+        type=parse_filter,
+        action="append",
+        default=[],
+        help='Keep episodes matching, can be repeated, e.g. -F "epoch>=100"',
+    )
+    parser.add_argument(
+        "-O", "--out-dir", type=str, default=None, help="Write the results here instead of in place"
+    )
+    parser.add_argument(
+        "-C", "--chunk", type=int, default=1000, help="Episodes held in memory per file"
+    )
+    parser.add_argument(
+        "-W", "--workers", type=int, default=None, help="Files transformed in parallel"
+    )
+    args = parser.parse_args()
+
+    columns = {"epist": "aleat", "aleat": "epist"} if args.swap else _assignments(args.map, str)
+    scale = _assignments(args.scale, float)
+    if args.out_dir and not os.path.exists(args.out_dir):
+        os.makedirs(args.out_dir)
 
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = []
+        for path in args.paths:
+            out_path = None
+            if args.out_dir:
+                name = os.path.splitext(os.path.basename(path))[0]
+                out_path = os.path.join(args.out_dir, f"{name}.trace")
+            futures.append(
+                (
+                    path,
+                    pool.submit(
+                        transform_file,
+                        path,
+                        out_path=out_path,
+                        chunk_episodes=args.chunk,
+                        columns=columns,
+                        scale=scale,
+                        filters=args.filter,
+                    ),
+                )
+            )
+        for path, future in futures:
+            print(f"{path} -> {future.result()}")
@@ -0,0 +1,122 @@
+import numpy as np
+
+_NAN_ = -1
+
+
+def pad_curves(curves):
+    """Stack curves of different lengths into a NaN padded 2-D array
+
+    Returns:
+        tuple: (nb_curves, max_length) float64 values and the length of every curve
+    """
+    lengths = np.array([len(curve) for curve in curves], dtype=np.int64)
+    values = np.full((len(curves), lengths.max() if len(curves) else 0), np.nan)
+    for idx, curve in enumerate(curves):
+        values[idx, : lengths[idx]] = curve
+    return values, lengths
+
+
+def compact(values, mask):
+    """Move the masked values of every row to its start, keeping their order
+
+    Returns:
+        tuple: Compacted values, number of masked values per row and the column each value came from
+    """
+    order = np.argsort(~mask, axis=1, kind="stable")
+    return np.take_along_axis(values, order, axis=1), mask.sum(axis=1), order
+
+
+def reflect_index(index, lengths):
+    """Index into rows of the given lengths with scipy's "reflect" boundary (d c b a | a b c d | d c b a)"""
+    lengths = np.maximum(lengths, 1)
+    period = 2 * lengths
+    index = np.mod(index, period)
+    return np.where(index >= lengths, period - 1 - index, index)
+
+
+def gaussian_kernel(sigma, truncate=4.0):
+    """Weights of scipy.ndimage.gaussian_filter1d"""
+    radius = int(truncate * float(sigma) + 0.5)
+    x = np.arange(-radius, radius + 1)
+    weights = np.exp(-0.5 / sigma ** 2 * x ** 2)
+    return weights / weights.sum(), radius
+
+
+def gaussian_smooth(values, lengths, sigma):
+    """Gaussian filter every row over its first lengths[row] values, like gaussian_filter1d on each row
+
+    Every row is padded with its own reflection, so the whole array is filtered by a single correlation.
+
+    Args:
+        values (np.ndarray): (nb_curves, max_length) values, only the first lengths[row] of a row are used
+        lengths (np.ndarray): Valid values of every row
+        sigma (float): Standard deviation of the gaussian kernel
+
+    Returns:
+        np.ndarray: Smoothed values, NaN past the length of every row
+    """
+    from scipy.ndimage import correlate1d
+
+    weights, radius = gaussian_kernel(sigma)
+    positions = np.arange(values.shape[1])
+    index = reflect_index(np.arange(-radius, values.shape[1] + radius)[None, :], lengths[:, None])
+    padded = np.take_along_axis(values, index, axis=1)
+    smoothed = correlate1d(padded, weights, axis=1, mode="constant")[:, radius : radius + values.shape[1]]
+    smoothed[positions[None, :] >= lengths[:, None]] = np.nan
+    return smoothed
+
+
+def scale_rows(values, mask):
+    """scale01 of the masked values of every row
+
+    Returns:
+        tuple: Scaled values and the (max - min) magnitude of every row
+    """
+    high = np.where(mask, values, -np.inf).max(axis=1, initial=-np.inf)
+    low = np.where(mask, values, np.inf).min(axis=1, initial=np.inf)
+    span = high - low
+    flat = span == 0
+    # Constant rows are divided by their value, like scale01
+    divisor = np.where(flat, np.where(high == 0, 1, high), span)
+    offset = np.where(flat, 0, low)
+    with np.errstate(invalid="ignore"):
+        scaled = (values - offset[:, None]) / divisor[:, None]
+    magnitudes = np.where(flat | ~np.isfinite(span), 0, span)
+    return np.where(mask, scaled, values), magnitudes
+
+
+def prepare_curves(curves, smooth=None, multipliers=None, scale=True, nan=_NAN_):
+    """Smooth and scale the curves of several models at once
+
+    NaN points are left out of smoothing and scaling, then set to nan, as the plots
+    did model by model with nan_to_num, a masked gaussian_filter1d and scale01.
+
+    Args:
+        curves (list): 1-D curves, one per model, of any length
+        smooth (float, optional): Gaussian sigma, no smoothing if None. Defaults to None.
+        multipliers (list, optional): Factor of every curve applied before scaling. Defaults to None.
+        scale (bool, optional): Scale every curve to [0, 1]. Defaults to True.
+        nan (float, optional): Value given to NaN points. Defaults to -1.
+
+    Returns:
+        tuple: List of processed curves and the magnitude of every curve, 0 if not scaled
+    """
+    if not len(curves):
+        return [], np.zeros(0)
+    values, lengths = pad_curves(curves)
+    valid = ~np.isnan(values)
+
+    compacted, nb_valid, order = compact(values, valid)
+    if smooth is not None:
+        compacted = gaussian_smooth(compacted, nb_valid, smooth)
+    kept = np.arange(values.shape[1])[None, :] < nb_valid[:, None]
+    if multipliers is not None:
+        compacted = compacted * np.asarray(multipliers, dtype=np.float64)[: len(curves), None]
+    magnitudes = np.zeros(len(curves))
+    if scale:
+        compacted, magnitudes = scale_rows(compacted, kept)
+
+    # Put the valid values back at their original positions
+    processed = np.full_like(values, nan)
+    np.put_along_axis(processed, order, np.where(kept, compacted, nan), axis=1)
+    return [processed[idx, : lengths[idx]] for idx in range(len(curves))], magnitudes
@@ -1,5 +1,13 @@
 from collections import deque
+import itertools
 import random
+import os
+import numpy as np
+import torch
+
+
+def _dump_arrays(arrays, f):
+    np.savez(f, **arrays)
 
 class ReplayMemory(object):
 
@@ -15,10 +23,19 @@ class ReplayMemory(object):
         self._capacity = capacity
         self.batch_size = batch_size
         self._Transition = Transition
+        self._nb_pushed = 0
+        self._nb_saved = 0
+        self._saved_path = None
 
     def push(self, *args):
         """Save a experiences"""
         self.memory.append(self._Transition(*args))
+        self._nb_pushed += 1
+
+    def push_batch(self, *args):
+        """Save several experiences, every field with a leading dimension of the number of experiences"""
+        self._extend(dict(zip(self._Transition._fields, args)))
+        self._nb_pushed += len(args[0])
     
     def empty(self):
         """Empty memory"""        
@@ -31,16 +48,30 @@ class ReplayMemory(object):
             Exception: Number of experiences is less than the required
 
         Returns:
-            list: Sample of experiences (state, action, next state, reward, done)
+            Transition: Tensors of shape (batch_size, ...) for every field, as for every buffer
         """        
         if len(self) < self.batch_size:
             raise Exception('Number of experiences is less than the required')
         random_samp =  random.sample(self.memory, self.batch_size)
-        return self._Transition(*zip(*random_samp))
+        return self._stack(random_samp)
+
+    def sample_batches(self, nb_batches):
+        """Sample several batches of experiences
+
+        The deque is sampled one batch at a time, ArrayReplayMemory draws every batch at once.
+
+        Returns:
+            Transition: Tensors of shape (nb_batches, batch_size, ...) for every field
+        """
+        batches = [self.sample() for _ in range(nb_batches)]
+        return self._Transition(*[torch.stack(field) for field in zip(*batches)])
     
     def dataset(self):
-        data =  self._Transition(*zip(*self.memory))
-        return data
+        """Every experience, oldest first, as tensors of shape (len, ...) for every field"""
+        return self._stack(self.memory)
+
+    def _stack(self, experiences):
+        return self._Transition(*[torch.cat(values) for values in zip(*experiences)])
 
     def __len__(self):
         return len(self.memory)
@@ -48,9 +79,238 @@ class ReplayMemory(object):
     def able_sample(self):
         return len(self) >= self.batch_size
 
+    def end_episode(self):
+        """Experiences are complete when pushed, nothing is pending at the end of an episode"""
+        pass
+
     def is_memory_full(self):
         return len(self) == self._capacity
 
+    def save(self, path, checkpointer=None):
+        """Save experiences to a folder of numpy chunks
+
+        Only experiences pushed since the previous save are written, chunks of
+        experiences that already left the memory are deleted.
+
+        Args:
+            path (str): Chunks folder
+            checkpointer (Checkpointer, optional): Writes the chunk in background. Defaults to None.
+
+        Returns:
+            dict: Memory position, needed to load the chunks back
+        """
+        if not os.path.exists(path):
+            os.makedirs(path)
+        if path != self._saved_path:
+            self._nb_saved = 0
+            self._saved_path = path
+        first = self._nb_pushed - len(self)
+        start = max(self._nb_saved, first)
+        if start < self._nb_pushed:
+            arrays = self._arrays(start - first)
+            chunk = f"{path}/{start:012d}_{self._nb_pushed - start}.npz"
+            if checkpointer is not None:
+                checkpointer.save(arrays, chunk, dump=_dump_arrays)
+            else:
+                with open(chunk, "wb") as f:
+                    _dump_arrays(arrays, f)
+        for chunk_start, chunk_len, chunk in self._chunks(path):
+            if chunk_start + chunk_len <= first:
+                os.remove(chunk)
+        self._nb_saved = self._nb_pushed
+        return {"nb_pushed": self._nb_pushed, "length": len(self)}
+
+    def load(self, path, position):
+        """Load experiences saved with save
+
+        Args:
+            path (str): Chunks folder
+            position (dict): Memory position returned by save
+        """
+        self.empty()
+        nb_pushed = position["nb_pushed"]
+        first = nb_pushed - position["length"]
+        for chunk_start, chunk_len, chunk in self._chunks(path):
+            lo = max(first, chunk_start)
+            hi = min(nb_pushed, chunk_start + chunk_len)
+            if lo < hi:
+                with np.load(chunk) as data:
+                    self._extend(
+                        {
+                            field: data[field][lo - chunk_start : hi - chunk_start]
+                            for field in self._Transition._fields
+                        }
+                    )
+            # Chunks written after the saved position belong to a run that did not finish
+            if chunk_start + chunk_len > nb_pushed:
+                os.remove(chunk)
+        self._nb_pushed = nb_pushed
+        self._nb_saved = nb_pushed
+        self._saved_path = path
+
+    def _arrays(self, start):
+        """Numpy arrays of every field from the experience start, oldest first"""
+        new = list(itertools.islice(self.memory, start, None))
+        return {
+            field: torch.cat(values).numpy()
+            for field, values in zip(self._Transition._fields, zip(*new))
+        }
+
+    def _extend(self, arrays):
+        fields = [arrays[field] for field in self._Transition._fields]
+        for idx in range(fields[0].shape[0]):
+            self.memory.append(
+                self._Transition(*[torch.as_tensor(array[idx : idx + 1]) for array in fields])
+            )
+
+    @staticmethod
+    def _chunks(path):
+        chunks = []
+        for name in sorted(os.listdir(path)):
+            if name.endswith(".npz"):
+                start, length = name[:-4].split("_")
+                chunks.append((int(start), int(length), f"{path}/{name}"))
+        return chunks
+
+
+class ArrayReplayMemory(ReplayMemory):
+    def __init__(self, capacity, batch_size, Transition):
+        """Replay Buffer storing every field in a preallocated ring of tensors
+
+        Experiences are pushed like in ReplayMemory, as tensors with a leading dimension of 1.
+        Batches are sampled with replacement, with a single index draw and gather per field.
+
+        Args:
+            capacity (int): Maximum number of experiences
+            batch_size (int): Number of experiences to sample
+            Transition (namedtuple): Transition schema
+        """
+        super(ArrayReplayMemory, self).__init__(capacity, batch_size, Transition)
+        self.memory = None
+        self._capacity = int(capacity)
+        self._position = 0
+        self._size = 0
+
+    def _allocate(self, values):
+        self.memory = self._Transition(
+            *[torch.empty((self._capacity,) + tuple(value.shape[1:]), dtype=value.dtype) for value in values]
+        )
+
+    def push(self, *args):
+        """Save a experiences"""
+        self._extend(
+            {field: torch.as_tensor(value) for field, value in zip(self._Transition._fields, args)}
+        )
+        self._nb_pushed += 1
+
+    def empty(self):
+        """Empty memory"""
+        self._position = 0
+        self._size = 0
+
+    def _order(self):
+        """Ring positions from the oldest experience to the newest"""
+        return (torch.arange(self._size) + self._position - self._size) % self._capacity
+
+    def sample(self):
+        """Sample experiences, with replacement
+
+        Returns:
+            Transition: Tensors of shape (batch_size, ...) for every field
+        """
+        return self._Transition(*[values[0] for values in self.sample_batches(1)])
+
+    def sample_batches(self, nb_batches):
+        if len(self) < self.batch_size:
+            raise Exception('Number of experiences is less than the required')
+        index = torch.randint(0, self._size, size=(nb_batches, self.batch_size))
+        index = (index + self._position - self._size) % self._capacity
+        return self._Transition(*[values[index] for values in self.memory])
+
+    def dataset(self):
+        order = self._order()
+        return self._Transition(*[values[order] for values in self.memory])
+
+    def __len__(self):
+        return self._size
+
+    def _arrays(self, start):
+        order = self._order()[start:]
+        return {field: values[order].numpy() for field, values in zip(self._Transition._fields, self.memory)}
+
+    def _extend(self, arrays):
+        values = [torch.as_tensor(arrays[field]) for field in self._Transition._fields]
+        if self.memory is None:
+            self._allocate(values)
+        length = values[0].shape[0]
+        if length > self._capacity:
+            values = [value[-self._capacity :] for value in values]
+            length = self._capacity
+        index = (torch.arange(length) + self._position) % self._capacity
+        for storage, value in zip(self.memory, values):
+            storage[index] = value.to(storage.dtype)
+        self._position = (self._position + length) % self._capacity
+        self._size = min(self._size + length, self._capacity)
+
+
+class NStepMemory(object):
+    def __init__(self, buffer: ReplayMemory, n_steps, gamma):
+        """N-step transitions on top of a Replay Buffer
+
+        Experiences are pushed one step at a time, as to the wrapped buffer but without
+        the discount field. Once n steps later is known, or the episode ends, the
+        experience is stored with the discounted return of its next steps, the state to
+        bootstrap from as next_state and the discount of that bootstrap. The return is
+        summed again over the at most n pending rewards at every emission, a sliding sum
+        would divide by gamma at every step and blow up its rounding error over an episode.
+
+        Args:
+            buffer (ReplayMemory): Buffer whose Transition has a discount field
+            n_steps (int): Steps of the returns
+            gamma (float): Discount factor
+        """
+        self._buffer = buffer
+        self._n_steps = n_steps
+        self._gamma = gamma
+        self._powers = [gamma ** k for k in range(n_steps + 1)]
+        self._fields = [field for field in buffer._Transition._fields if field != "discount"]
+        self._pending = deque()
+
+    def __getattr__(self, name):
+        return getattr(self._buffer, name)
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def push(self, *args):
+        """Save a experiences"""
+        experience = dict(zip(self._fields, args))
+        self._pending.append(experience)
+        if len(self._pending) == self._n_steps:
+            self._emit(experience["next_state"], experience["done"])
+        if float(experience["done"]):
+            while self._pending:
+                self._emit(experience["next_state"], experience["done"])
+
+    def end_episode(self):
+        """Store the experiences still waiting for their next steps, bootstrapping from the last state"""
+        if self._pending:
+            last = self._pending[-1]
+            while self._pending:
+                self._emit(last["next_state"], last["done"])
+
+    def _emit(self, next_state, done):
+        n_return = sum(power * float(pending["reward"]) for power, pending in zip(self._powers, self._pending))
+        experience = dict(
+            self._pending[0],
+            next_state=next_state,
+            reward=torch.Tensor([n_return]),
+            done=done,
+            discount=torch.Tensor([self._powers[len(self._pending)]]),
+        )
+        self._buffer.push(*[experience[field] for field in self._buffer._Transition._fields])
+        self._pending.popleft()
+
 
 if __name__ == "__main__":
     import numpy as np
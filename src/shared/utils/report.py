@@ -0,0 +1,110 @@
+import os
+import json
+import hashlib
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from termcolor import colored
+
+from shared.utils.trace import resolve
+from shared.utils.trace_cache import fingerprint
+from shared.utils.uncertainties import read_uncert_summary
+
+# output: file written by func, inputs: uncertainty files read by func(*args, **kwargs)
+Figure = namedtuple("Figure", ("output", "func", "args", "kwargs", "inputs"))
+
+
+def figure_key(figure):
+    """Hash of what a figure depends on: the function, its arguments and its input files"""
+    inputs = []
+    for path in figure.inputs:
+        path = resolve(path)
+        inputs.append([path, fingerprint(path).tolist()])
+    description = [
+        figure.func.__module__,
+        figure.func.__name__,
+        repr(figure.args),
+        repr(sorted(figure.kwargs.items())),
+        inputs,
+    ]
+    return hashlib.sha1(json.dumps(description).encode()).hexdigest()
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+def _render(figure):
+    import matplotlib.pyplot as plt
+
+    figure.func(*figure.args, **figure.kwargs)
+    plt.close("all")
+    return figure.output
+
+
+class ReportBuilder:
+    def __init__(self, out_path="images", workers=None, force=False) -> None:
+        """Renders a set of figures in a process pool, skipping those whose inputs did not change
+
+        Args:
+            out_path (str, optional): Folder of the figures and of manifest.json. Defaults to "images".
+            workers (int, optional): Processes, defaults to the number of cpus.
+            force (bool, optional): Render every figure. Defaults to False.
+        """
+        self._out_path = out_path
+        self._workers = workers
+        self._force = force
+        self._manifest_path = f"{out_path}/manifest.json"
+        self._manifest = {}
+        if not os.path.exists(out_path):
+            os.makedirs(out_path)
+        if os.path.exists(self._manifest_path):
+            with open(self._manifest_path, "r") as f:
+                self._manifest = json.load(f)
+
+    def outdated(self, figures):
+        keys = {figure.output: figure_key(figure) for figure in figures}
+        return [
+            figure
+            for figure in figures
+            if self._force
+            or not os.path.exists(figure.output)
+            or self._manifest.get(figure.output) != keys[figure.output]
+        ], keys
+
+    def build(self, figures):
+        """Render the outdated figures
+
+        Returns:
+            list: Outputs that were rendered
+        """
+        todo, keys = self.outdated(figures)
+        for figure in figures:
+            if figure not in todo:
+                print(colored(f"{figure.output} is up to date", "cyan"))
+        if not todo:
+            return []
+
+        # Read every input once, so the workers find summaries of traces and the
+        # cached parse of legacy files, inherited when forked
+        for path in sorted({path for figure in todo for path in figure.inputs}):
+            read_uncert_summary(path)
+
+        rendered = []
+        with ProcessPoolExecutor(max_workers=self._workers, initializer=_init_worker) as pool:
+            futures = [(figure, pool.submit(_render, figure)) for figure in todo]
+            for figure, future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    print(colored(f"{figure.output} failed: {e}", "red"))
+                    continue
+                self._manifest[figure.output] = keys[figure.output]
+                rendered.append(figure.output)
+                print(colored(f"{figure.output} rendered", "green"))
+
+        tmp_path = f"{self._manifest_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self._manifest_path)
+        return rendered
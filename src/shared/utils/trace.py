@@ -0,0 +1,464 @@
+import os
+import sys
+from collections import namedtuple
+import numpy as np
+
+# Uncertainty traces are stored as three files:
+#   {path}          float32 payload, each episode stores its epistemic values then its aleatoric values
+#   {path}.summary  magic followed by one fixed size record of per episode statistics
+#   {path}.idx      magic followed by one fixed size header record per episode
+# The index is written last, an episode exists once its header is complete.
+MAGIC = b"UTRACE1\n"
+SUMMARY_MAGIC = b"USUMRY1\n"
+INDEX_DTYPE = np.dtype(
+    [
+        ("epoch", "<f8"),
+        ("val_idx", "<i8"),
+        ("score", "<f8"),
+        ("sigma", "<f8"),
+        ("offset", "<i8"),
+        ("length", "<i8"),
+    ]
+)
+
+SUMMARY_DTYPE = np.dtype(
+    [
+        ("epoch", "<f8"),
+        ("val_idx", "<i8"),
+        ("score", "<f8"),
+        ("sigma", "<f8"),
+        ("length", "<i8"),
+        ("mean_epist", "<f4"),
+        ("std_epist", "<f4"),
+        ("mean_aleat", "<f4"),
+        ("std_aleat", "<f4"),
+    ]
+)
+
+Trace = namedtuple(
+    "Trace", ("epochs", "val_idx", "score", "sigma", "offsets", "lengths", "epist", "aleat")
+)
+
+
+def index_path(path):
+    return f"{path}.idx"
+
+
+def summary_path(path):
+    return f"{path}.summary"
+
+
+def _nb_records(file, magic, dtype):
+    if not os.path.exists(file):
+        return -1
+    return max(0, (os.path.getsize(file) - len(magic)) // dtype.itemsize)
+
+
+def _trim_summary(path):
+    """Drop summary bytes past the index or of a partial record, returns the summary records left
+
+    Only for the writer of the trace, readers skip those bytes instead.
+    """
+    nb_summary = _nb_records(summary_path(path), SUMMARY_MAGIC, SUMMARY_DTYPE)
+    if nb_summary < 0:
+        return nb_summary
+    nb_summary = min(nb_summary, _nb_records(index_path(path), MAGIC, INDEX_DTYPE))
+    size = len(SUMMARY_MAGIC) + nb_summary * SUMMARY_DTYPE.itemsize
+    if os.path.getsize(summary_path(path)) > size:
+        os.truncate(summary_path(path), size)
+    return nb_summary
+
+
+def is_trace(path):
+    return os.path.exists(index_path(path))
+
+
+def resolve(path):
+    """Path to read for path, its .trace or legacy .txt sibling only if path does not exist"""
+    root, extension = os.path.splitext(path)
+    if extension == ".txt" and not os.path.exists(path) and is_trace(f"{root}.trace"):
+        return f"{root}.trace"
+    if extension == ".trace" and not is_trace(path) and os.path.exists(f"{root}.txt"):
+        return f"{root}.txt"
+    return path
+
+
+def init_trace(path):
+    with open(path, "wb"):
+        pass
+    with open(summary_path(path), "wb") as f:
+        f.write(SUMMARY_MAGIC)
+    with open(index_path(path), "wb") as f:
+        f.write(MAGIC)
+
+
+def replace_trace(source, path):
+    """Rename the trace source over path, the index last"""
+    os.replace(source, path)
+    if os.path.exists(summary_path(source)):
+        os.replace(summary_path(source), summary_path(path))
+    elif os.path.exists(summary_path(path)):
+        os.remove(summary_path(path))
+    os.replace(index_path(source), index_path(path))
+
+
+def episode_mean_std(flat, lengths):
+    """Mean and population std of every episode of a flat ragged array, NaN for empty episodes"""
+    lengths = np.asarray(lengths, dtype=np.int64)
+    mean = np.full(lengths.shape[0], np.nan)
+    std = np.full(lengths.shape[0], np.nan)
+    filled = lengths > 0
+    if not np.any(filled):
+        return mean, std
+    flat = np.asarray(flat, dtype=np.float64)
+    starts = (np.cumsum(lengths) - lengths)[filled]
+    # Empty episodes add no values, so each start of a filled episode closes the previous one
+    mean[filled] = np.add.reduceat(flat, starts) / lengths[filled]
+    deviation = flat - np.repeat(mean[filled], lengths[filled])
+    std[filled] = np.sqrt(np.add.reduceat(deviation ** 2, starts) / lengths[filled])
+    return mean, std
+
+
+def summarize(headers, payload, first=0):
+    """Summary records of episodes
+
+    Args:
+        headers (np.ndarray): INDEX_DTYPE records
+        payload (np.ndarray): float32 values, element 0 being at byte offset first
+    """
+    lengths = headers["length"].astype(np.int64)
+    offsets = np.zeros(lengths.shape[0], dtype=np.int64)
+    np.cumsum(lengths[:-1], out=offsets[1:])
+    steps = np.arange(int(lengths.sum())) - np.repeat(offsets, lengths)
+    epist_idx = np.repeat((headers["offset"] - first) // 4, lengths) + steps
+    mean_epist, std_epist = episode_mean_std(payload[epist_idx], lengths)
+    mean_aleat, std_aleat = episode_mean_std(payload[epist_idx + np.repeat(lengths, lengths)], lengths)
+
+    summary = np.zeros(headers.shape[0], dtype=SUMMARY_DTYPE)
+    for name in ("epoch", "val_idx", "score", "sigma", "length"):
+        summary[name] = headers[name]
+    summary["mean_epist"] = mean_epist
+    summary["std_epist"] = std_epist
+    summary["mean_aleat"] = mean_aleat
+    summary["std_aleat"] = std_aleat
+    return summary
+
+
+def append_episodes(path, headers, payload):
+    """Append episodes to a trace
+
+    The payload and summary are written before the headers, so an interrupted write
+    leaves at most unreferenced bytes and a partial header that readers ignore.
+
+    Args:
+        path (str): Trace path
+        headers (np.ndarray): INDEX_DTYPE records, offsets relative to the start of payload in bytes
+        payload (np.ndarray): float32 values of every episode
+    """
+    payload = np.ascontiguousarray(payload, dtype=np.float32)
+    with open(path, "ab") as f:
+        f.seek(0, os.SEEK_END)
+        start = f.tell()
+        f.write(payload.tobytes())
+
+    # The writer is the only one repairing the summary, so it matches the index before growing
+    ensure_summary(path)
+    with open(summary_path(path), "ab") as f:
+        f.write(summarize(headers, payload).tobytes())
+
+    headers = headers.copy()
+    headers["offset"] += start
+    with open(index_path(path), "ab") as f:
+        f.write(headers.tobytes())
+
+
+def append_episode(path, epoch, val_idx, score, uncert, sigma=None):
+    """Append one evaluation episode
+
+    Args:
+        path (str): Trace path
+        epoch (int): Training episode of the evaluation
+        val_idx (int): Evaluation index
+        score (float): Episode score
+        uncert (np.ndarray): (steps, 2) epistemic and aleatoric uncertainty of every step
+        sigma (float, optional): Noise of the episode. Defaults to None.
+    """
+    uncert = np.asarray(uncert, dtype=np.float32).reshape(-1, 2)
+    header = np.zeros(1, dtype=INDEX_DTYPE)
+    header["epoch"] = epoch
+    header["val_idx"] = val_idx
+    header["score"] = score
+    header["sigma"] = np.nan if sigma is None else sigma
+    header["length"] = uncert.shape[0]
+    append_episodes(path, header, uncert.T.reshape(-1))
+
+
+def read_index(path, start=0, count=None):
+    """Read the episode headers of a trace, from record start on, at most count of them"""
+    with open(index_path(path), "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not an uncertainty trace")
+        f.seek(len(MAGIC) + start * INDEX_DTYPE.itemsize)
+        data = f.read() if count is None else f.read(count * INDEX_DTYPE.itemsize)
+    # Ignore a header that is still being written
+    nb_records = len(data) // INDEX_DTYPE.itemsize
+    return np.frombuffer(data[: nb_records * INDEX_DTYPE.itemsize], dtype=INDEX_DTYPE)
+
+
+def pack_payload(headers, payload, first=0):
+    """Gather the values of the episodes of headers into a contiguous payload
+
+    Args:
+        headers (np.ndarray): INDEX_DTYPE records
+        payload (np.ndarray): float32 values, element 0 being at byte offset first of the trace
+
+    Returns:
+        tuple: Headers with offsets relative to the packed payload, packed payload
+    """
+    sizes = 2 * headers["length"].astype(np.int64)
+    starts = np.zeros(sizes.shape[0], dtype=np.int64)
+    np.cumsum(sizes[:-1], out=starts[1:])
+    steps = np.arange(int(sizes.sum())) - np.repeat(starts, sizes)
+    packed = payload[np.repeat((headers["offset"] - first) // 4, sizes) + steps]
+    headers = headers.copy()
+    headers["offset"] = 4 * starts
+    return headers, packed
+
+
+def iter_episodes(path, chunk_episodes=1000):
+    """Stream the episodes of a trace or legacy text file in chunks
+
+    Yields:
+        tuple: INDEX_DTYPE headers with offsets relative to the chunk payload, and the
+            float32 payload holding epist then aleat of every episode, as taken by append_episodes
+    """
+    if not is_trace(path):
+        with open(path, "r") as f:
+            rows = []
+            for row in f:
+                if row.endswith("\n"):
+                    rows.append(row)
+                if len(rows) == chunk_episodes:
+                    yield _parse_rows(rows)
+                    rows = []
+            if rows:
+                yield _parse_rows(rows)
+        return
+
+    start = 0
+    while True:
+        headers = read_index(path, start=start, count=chunk_episodes)
+        if headers.shape[0] == 0:
+            return
+        start += headers.shape[0]
+        first = int(headers["offset"].min())
+        end = int((headers["offset"] + 8 * headers["length"]).max())
+        with open(path, "rb") as f:
+            f.seek(first)
+            payload = np.frombuffer(f.read(end - first), dtype=np.float32)
+        yield pack_payload(headers, payload, first=first)
+
+
+def _parse_rows(rows):
+    headers = np.zeros(len(rows), dtype=INDEX_DTYPE)
+    payload = []
+    offset = 0
+    for idx, row in enumerate(rows):
+        values = np.fromstring(row, dtype=np.float32, sep=",")
+        headers[idx]["epoch"] = values[0]
+        headers[idx]["val_idx"] = values[1]
+        headers[idx]["score"] = values[2]
+        headers[idx]["sigma"] = values[3]
+        headers[idx]["offset"] = offset
+        headers[idx]["length"] = (len(values) - 4) // 2
+        payload.append(values[4:])
+        offset += 4 * (len(values) - 4)
+    return headers, np.concatenate(payload)
+
+
+def read_trace(path, start=0):
+    """Read a trace into flat arrays
+
+    Returns:
+        Trace: Per episode headers, and epist/aleat holding the steps of every episode
+            back to back, episode i being [offsets[i], offsets[i] + lengths[i])
+    """
+    index = read_index(path, start=start)
+    lengths = index["length"].astype(np.int64)
+    offsets = np.zeros(lengths.shape[0], dtype=np.int64)
+    np.cumsum(lengths[:-1], out=offsets[1:])
+    total = int(lengths.sum())
+
+    if total:
+        first = int(index["offset"][0])
+        end = int(index["offset"][-1]) + 8 * int(lengths[-1])
+        with open(path, "rb") as f:
+            f.seek(first)
+            payload = np.frombuffer(f.read(end - first), dtype=np.float32)
+        # Element of step j of episode i is at (offset_i - first) / 4 + j
+        steps = np.arange(total) - np.repeat(offsets, lengths)
+        epist_idx = np.repeat((index["offset"] - first) // 4, lengths) + steps
+        epist = payload[epist_idx]
+        aleat = payload[epist_idx + np.repeat(lengths, lengths)]
+    else:
+        epist = np.zeros(0, dtype=np.float32)
+        aleat = np.zeros(0, dtype=np.float32)
+
+    return Trace(
+        index["epoch"].astype(np.float32),
+        index["val_idx"].astype(np.float32),
+        index["score"].astype(np.float32),
+        index["sigma"].astype(np.float32),
+        offsets,
+        lengths,
+        epist,
+        aleat,
+    )
+
+
+def read_txt(path, start=0):
+    """Parse a legacy comma separated uncertainty file into flat arrays
+
+    Args:
+        path (str): Legacy file
+        start (int, optional): Byte offset to parse from. Defaults to 0.
+
+    Returns:
+        tuple: Trace of the complete rows and byte offset after the last one
+    """
+    epochs, val_idx, score, sigma, lengths, epist, aleat = [], [], [], [], [], [], []
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read()
+    # A row still being written has no newline yet
+    end = data.rfind(b"\n") + 1
+    for row in data[:end].splitlines():
+        values = np.fromstring(row, dtype=np.float32, sep=",")
+        length = (len(values) - 4) // 2
+        epochs.append(values[0])
+        val_idx.append(values[1])
+        score.append(values[2])
+        sigma.append(values[3])
+        lengths.append(length)
+        epist.append(values[4 : 4 + length])
+        aleat.append(values[4 + length :])
+
+    lengths = np.array(lengths, dtype=np.int64)
+    offsets = np.zeros(lengths.shape[0], dtype=np.int64)
+    np.cumsum(lengths[:-1], out=offsets[1:])
+    empty = np.zeros(0, dtype=np.float32)
+    trace = Trace(
+        np.array(epochs, dtype=np.float32),
+        np.array(val_idx, dtype=np.float32),
+        np.array(score, dtype=np.float32),
+        np.array(sigma, dtype=np.float32),
+        offsets,
+        lengths,
+        np.concatenate(epist) if epist else empty,
+        np.concatenate(aleat) if aleat else empty,
+    )
+    return trace, start + end
+
+
+def concat_traces(first, second):
+    """Trace holding the episodes of first followed by those of second"""
+    offsets = np.concatenate([first.offsets, second.offsets + first.lengths.sum()])
+    return Trace(
+        *[np.concatenate([a, b]) for a, b in zip(first[:4], second[:4])],
+        offsets,
+        np.concatenate([first.lengths, second.lengths]),
+        np.concatenate([first.epist, second.epist]),
+        np.concatenate([first.aleat, second.aleat]),
+    )
+
+
+def _summarize_range(path, start, stop, chunk_episodes=10000):
+    """Summary records of the episodes start to stop of the index, computed from the payload
+
+    Yields:
+        np.ndarray: SUMMARY_DTYPE records of up to chunk_episodes episodes
+    """
+    while start < stop:
+        headers = read_index(path, start=start, count=min(chunk_episodes, stop - start))
+        if headers.shape[0] == 0:
+            return
+        first = int(headers["offset"].min())
+        end = int((headers["offset"] + 8 * headers["length"]).max())
+        with open(path, "rb") as f:
+            f.seek(first)
+            payload = np.frombuffer(f.read(end - first), dtype=np.float32)
+        yield summarize(headers, payload, first=first)
+        start += headers.shape[0]
+
+
+def ensure_summary(path, chunk_episodes=10000):
+    """Bring the summary of a trace in line with its index, building it for traces written without one
+
+    This writes the summary, only the writer of the trace or a caller holding a lock
+    on it may call it. Readers get the missing records from read_summary in memory.
+    """
+    nb_index = _nb_records(index_path(path), MAGIC, INDEX_DTYPE)
+    if not os.path.exists(summary_path(path)):
+        with open(summary_path(path), "wb") as f:
+            f.write(SUMMARY_MAGIC)
+    nb_summary = _trim_summary(path)
+    with open(summary_path(path), "ab") as f:
+        for summary in _summarize_range(path, nb_summary, nb_index, chunk_episodes):
+            f.write(summary.tobytes())
+
+
+def read_summary(path):
+    """Per episode statistics of a trace, without reading its per step payload
+
+    Never writes: summary records past the index are skipped, and those the summary
+    still misses, e.g. while the writer commits an episode, are computed in memory.
+
+    Returns:
+        np.ndarray: SUMMARY_DTYPE records of every complete episode
+    """
+    nb_index = _nb_records(index_path(path), MAGIC, INDEX_DTYPE)
+    nb_summary = min(max(0, _nb_records(summary_path(path), SUMMARY_MAGIC, SUMMARY_DTYPE)), nb_index)
+    data = b""
+    if nb_summary > 0:
+        with open(summary_path(path), "rb") as f:
+            if f.read(len(SUMMARY_MAGIC)) != SUMMARY_MAGIC:
+                raise ValueError(f"{path} has no valid summary")
+            data = f.read(nb_summary * SUMMARY_DTYPE.itemsize)
+    summary = np.frombuffer(data, dtype=SUMMARY_DTYPE)
+    if nb_summary < nb_index:
+        summary = np.concatenate([summary, *_summarize_range(path, nb_summary, nb_index)])
+    return summary
+
+
+def split_episodes(flat, trace):
+    """Per episode views of a flat epist or aleat array"""
+    return np.split(flat, np.cumsum(trace.lengths)[:-1]) if len(trace.lengths) else []
+
+
+def convert_txt(txt_path, path=None, chunk_rows=1000):
+    """Convert a legacy comma separated uncertainty file to a trace
+
+    Args:
+        txt_path (str): Legacy file, one "epoch,val_idx,score,sigma,epist...,aleat..." row per episode
+        path (str, optional): Trace path. Defaults to txt_path with a .trace extension.
+        chunk_rows (int, optional): Episodes buffered between writes. Defaults to 1000.
+
+    Returns:
+        str: Trace path
+    """
+    if path is None:
+        path = f"{os.path.splitext(txt_path)[0]}.trace"
+    # Written next to the target and renamed at the end, so readers never see a partial conversion
+    tmp_path = f"{path}.tmp"
+    init_trace(tmp_path)
+
+    for headers, payload in iter_episodes(txt_path, chunk_episodes=chunk_rows):
+        append_episodes(tmp_path, headers, payload)
+    replace_trace(tmp_path, path)
+    return path
+
+
+if __name__ == "__main__":
+    # python trace.py uncertainties/train/*.txt
+    for txt_path in sys.argv[1:]:
+        print(f"{txt_path} -> {convert_txt(txt_path)}")
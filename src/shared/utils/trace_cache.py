@@ -0,0 +1,138 @@
+import os
+from collections import OrderedDict
+import numpy as np
+
+from shared.utils.trace import concat_traces, index_path, is_trace, read_trace, read_txt
+
+
+def cache_path(path):
+    return f"{path}.cache.npz"
+
+
+def fingerprint(path):
+    """Size and mtime of the files behind a trace or legacy text file"""
+    files = [path, index_path(path)] if is_trace(path) else [path]
+    stats = [os.stat(f) for f in files]
+    return np.array([value for st in stats for value in (st.st_size, st.st_mtime_ns)], dtype=np.int64)
+
+
+def head(path, size=256):
+    """First bytes of the file that grows on every append, to detect files rewritten from scratch"""
+    with open(index_path(path) if is_trace(path) else path, "rb") as f:
+        return np.frombuffer(f.read(size), dtype=np.uint8)
+
+
+def parse(path, start=0):
+    """Parse path from position start
+
+    Returns:
+        tuple: Trace and position to resume from, a record count for traces and a byte offset for text files
+    """
+    if is_trace(path):
+        trace = read_trace(path, start=start)
+        return trace, start + trace.epochs.shape[0]
+    return read_txt(path, start=start)
+
+
+class TraceCache:
+    def __init__(self, accumulate, finalize, max_entries=32, sidecar=False) -> None:
+        """Parsed and aggregated uncertainty files, kept in memory and optionally in .npz sidecars
+
+        Entries are keyed by path, size and mtime. A file that only grew since it
+        was cached, like the trace of a running training, is parsed from where the
+        cached parse stopped, and only its new episodes are added to the aggregation
+        state.
+
+        Args:
+            accumulate (callable): (Trace, state or None) -> state, a dict of arrays
+                adding the episodes of the trace to the state
+            finalize (callable): state -> dict of aggregated arrays
+            max_entries (int, optional): Files kept in memory. Defaults to 32.
+            sidecar (bool, optional): Whether to write {path}.cache.npz files holding
+                the aggregation state and parse position, never the parsed payload.
+                Defaults to False.
+        """
+        self._accumulate = accumulate
+        self._finalize = finalize
+        self._max_entries = max_entries
+        self._sidecar = sidecar
+        self._entries = OrderedDict()
+
+    def get(self, path):
+        """Parsed trace and aggregated arrays of path"""
+        key = os.path.abspath(path)
+        current = fingerprint(path)
+
+        entry = self._entries.pop(key, None)
+        if entry is None and self._sidecar:
+            entry = self._load_sidecar(path)
+        if entry is None or not np.array_equal(entry["fingerprint"], current):
+            entry = self._update(path, entry, current)
+            if self._sidecar:
+                self._save_sidecar(path, entry)
+        if entry["trace"] is None:
+            # Sidecars only hold the aggregation, the payload is read again
+            entry["trace"] = parse(path)[0]
+        if entry["aggregated"] is None:
+            entry["aggregated"] = self._finalize(entry["state"])
+
+        self._entries[key] = entry
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+        return entry["trace"], entry["aggregated"]
+
+    def clear(self):
+        self._entries.clear()
+
+    def _update(self, path, entry, current):
+        grown = (
+            entry is not None
+            and entry["fingerprint"].shape == current.shape
+            and np.all(current[::2] >= entry["fingerprint"][::2])
+            and np.array_equal(head(path, entry["head"].shape[0]), entry["head"])
+        )
+        if grown:
+            new, position = parse(path, start=entry["position"])
+            state = self._accumulate(new, entry["state"])
+            trace = concat_traces(entry["trace"], new) if entry["trace"] is not None else None
+        else:
+            trace, position = parse(path)
+            state = self._accumulate(trace, None)
+        return {
+            "fingerprint": current,
+            "head": head(path),
+            "position": position,
+            "trace": trace,
+            "state": state,
+            "aggregated": None,
+        }
+
+    def _load_sidecar(self, path):
+        if not os.path.exists(cache_path(path)):
+            return None
+        try:
+            with np.load(cache_path(path)) as data:
+                if "state_sums" not in data.files:
+                    # Sidecar of an older format
+                    return None
+                return {
+                    "fingerprint": data["fingerprint"],
+                    "head": data["head"],
+                    "position": int(data["position"]),
+                    "trace": None,
+                    "state": {name[len("state_"):]: data[name] for name in data.files if name.startswith("state_")},
+                    "aggregated": None,
+                }
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _save_sidecar(self, path, entry):
+        arrays = {f"state_{name}": value for name, value in entry["state"].items()}
+        tmp_path = f"{cache_path(path)}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.savez(f, fingerprint=entry["fingerprint"], head=entry["head"], position=entry["position"], **arrays)
+            os.replace(tmp_path, cache_path(path))
+        except OSError:
+            # Read only folders are still cached in memory
+            pass
@@ -0,0 +1,70 @@
+import os
+import numpy as np
+
+from shared.utils.trace import index_path, is_trace
+from shared.utils.trace_cache import head, parse
+from shared.utils.uncertainties import accumulate_trace, aggregate_state
+
+
+class TraceTail:
+    def __init__(self, path) -> None:
+        """Follows an uncertainty trace or legacy text file while it is written
+
+        Every poll parses only the rows appended since the previous one and adds
+        them to running per epoch sums, so a refresh costs a stat call when the
+        file did not change.
+
+        Args:
+            path (str): Trace or legacy .txt file
+        """
+        self.path = path
+        self._reset()
+
+    def _reset(self):
+        self._position = 0
+        self._size = -1
+        self._head = np.zeros(0, dtype=np.uint8)
+        self._state = None
+
+    def _watched_size(self):
+        watched = index_path(self.path) if is_trace(self.path) else self.path
+        return os.path.getsize(watched) if os.path.exists(watched) else -1
+
+    def poll(self):
+        """Parse the new rows
+
+        Returns:
+            np.ndarray: Epochs whose aggregates changed, empty if nothing was appended
+        """
+        size = self._watched_size()
+        if size == self._size:
+            return np.zeros(0, dtype=np.float32)
+        if size < self._size or (size >= 0 and not np.array_equal(head(self.path, self._head.shape[0]), self._head)):
+            # The file was restarted, e.g. by init_uncert_file, and may already have grown past the old size
+            self._reset()
+        self._size = size
+        if size < 0:
+            return np.zeros(0, dtype=np.float32)
+        self._head = head(self.path)
+
+        trace, self._position = parse(self.path, start=self._position)
+        if trace.epochs.shape[0] == 0:
+            return np.zeros(0, dtype=np.float32)
+
+        self._state = accumulate_trace(trace, self._state)
+        return np.unique(trace.epochs)
+
+    def get_aggregates(self):
+        """Per epoch aggregates of everything read so far, in the layout of process
+
+        Returns:
+            tuple: (unique_ep, mean_reward, mean_epist, mean_aleat), (std_reward, std_epist, std_aleat)
+        """
+        if self._state is None:
+            empty = np.zeros(0, dtype=np.float32)
+            return (empty, empty, empty, empty), (empty, empty, empty)
+        aggregated = aggregate_state(self._state)
+        return (
+            tuple(aggregated[name] for name in ("unique_ep", "mean_reward", "mean_epist", "mean_aleat")),
+            tuple(aggregated[name] for name in ("std_reward", "std_epist", "std_aleat")),
+        )
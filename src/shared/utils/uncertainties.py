@@ -1,10 +1,9 @@
 import numpy as np
-import matplotlib.pyplot as plt
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-from scipy.ndimage import gaussian_filter1d
 
-_NAN_ = -1
+from shared.utils.curves import _NAN_, prepare_curves
+from shared.utils.trace import episode_mean_std, is_trace, read_summary, resolve
+from shared.utils.trace_cache import TraceCache, parse
+
 def scale01(array):
     max_ = np.max(array)
     min_ = np.min(array)
@@ -15,51 +14,192 @@ def scale01(array):
             return array / max_, 0
     return (array - min_) / (max_ - min_), (max_ - min_)
 
-def read_uncert(path):
-    epochs = []
-    val_idx = []
-    reward = []
-    sigma = []
-    epist = []
-    aleat = []
-    with open(path, "r") as f:
-        for row in f:
-            data = np.array(row[:-1].split(",")).astype(np.float32)
-            epochs.append(data[0])
-            val_idx.append(data[1])
-            reward.append(data[2])
-            sigma.append(data[3])
-            l = len(data) - 4
-            epist.append(data[4 : l // 2 + 4])
-            aleat.append(data[l // 2 + 4 :])
-    return process(np.array(epochs), np.array(reward), epist, aleat), np.unique(sigma)
-
-
-def process(epochs, reward, epist, aleat):
-    unique_ep = np.unique(epochs)
-    mean_reward = np.zeros(unique_ep.shape, dtype=np.float32)
-    mean_epist = np.zeros(unique_ep.shape, dtype=np.float32)
-    mean_aleat = np.zeros(unique_ep.shape, dtype=np.float32)
-    std_reward = np.zeros(unique_ep.shape, dtype=np.float32)
-    std_epist = np.zeros(unique_ep.shape, dtype=np.float32)
-    std_aleat = np.zeros(unique_ep.shape, dtype=np.float32)
-    for idx, ep in enumerate(unique_ep):
-        indexes = np.argwhere(ep == epochs).astype(int)
-        mean_reward[idx] = np.mean(reward[indexes])
-        std_reward[idx] = np.std(reward[indexes])
-        for i in range(indexes.shape[0]):
-            mean_epist[idx] += np.mean(epist[indexes[i][0]]) / indexes.shape[0]
-            std_epist[idx] += np.std(epist[indexes[i][0]]) / indexes.shape[0]
-            mean_aleat[idx] += np.mean(aleat[indexes[i][0]]) / indexes.shape[0]
-            std_aleat[idx] += np.std(aleat[indexes[i][0]]) / indexes.shape[0]
+def read_uncert(path, cache=True):
+    """Read an uncertainty trace, or a legacy text file, and aggregate it by epoch
+
+    Args:
+        path (str): Trace or legacy .txt file
+        cache (bool, optional): Reuse the parse and aggregation of the file kept in
+            memory, only parsing and aggregating the episodes appended since. Defaults to True.
+    """
+    path = resolve(path)
+    if cache:
+        trace, aggregated = _cache.get(path)
+    else:
+        trace = parse(path)[0]
+        aggregated = aggregate_state(accumulate_trace(trace))
+    split = np.cumsum(trace.lengths)[:-1]
     return (
-        epochs,
-        (unique_ep, mean_reward, mean_epist, mean_aleat),
-        (std_reward, std_epist, std_aleat),
-        (epist, aleat),
+        (
+            trace.epochs,
+            (aggregated["unique_ep"], aggregated["mean_reward"], aggregated["mean_epist"], aggregated["mean_aleat"]),
+            (aggregated["std_reward"], aggregated["std_epist"], aggregated["std_aleat"]),
+            (np.split(trace.epist, split), np.split(trace.aleat, split)),
+        ),
+        aggregated["sigma"],
     )
 
 
+def read_uncert_summary(path):
+    """Read the per episode statistics of an uncertainty file and aggregate them by epoch
+
+    Traces answer from their .summary file without reading the per step payload.
+
+    Returns:
+        tuple: Same layout as read_uncert, except that the last element of the first
+            tuple holds the per episode mean epistemic and aleatoric uncertainty
+    """
+    path = resolve(path)
+    if is_trace(path):
+        summary = read_summary(path)
+        epochs = summary["epoch"].astype(np.float32)
+        score = summary["score"].astype(np.float32)
+        sigma = summary["sigma"].astype(np.float32)
+        stats = [summary[name] for name in ("mean_epist", "std_epist", "mean_aleat", "std_aleat")]
+    else:
+        trace = _cache.get(path)[0]
+        epochs, score, sigma = trace.epochs, trace.score, trace.sigma
+        stats = [*episode_mean_std(trace.epist, trace.lengths), *episode_mean_std(trace.aleat, trace.lengths)]
+    means, stds = aggregate_episodes(epochs, score, *stats)
+    return (epochs, means, stds, (stats[0].astype(np.float32), stats[2].astype(np.float32))), np.unique(sigma)
+
+
+# Columns of the per epoch sums of accumulate_trace
+_COUNT, _REWARD, _REWARD_SQ, _MEAN_EPIST, _STD_EPIST, _MEAN_ALEAT, _STD_ALEAT = range(7)
+
+
+def accumulate_trace(trace, state=None):
+    """Add the episodes of trace to running per epoch sums
+
+    Args:
+        trace (Trace): Episodes to add
+        state (dict, optional): Sums returned for the previous episodes. Defaults to None.
+
+    Returns:
+        dict: Sorted epochs, their (epochs, 7) sums and the unique sigmas
+    """
+    mean_epist, std_epist = episode_mean_std(trace.epist, trace.lengths)
+    mean_aleat, std_aleat = episode_mean_std(trace.aleat, trace.lengths)
+    score = trace.score.astype(np.float64)
+    values = np.stack([np.ones_like(score), score, score ** 2, mean_epist, std_epist, mean_aleat, std_aleat], axis=1)
+    epochs, sigma = trace.epochs.astype(np.float32), trace.sigma.astype(np.float32)
+    if state is not None:
+        # The sums of every known epoch are added like one more episode
+        epochs = np.concatenate([state["epochs"], epochs])
+        values = np.concatenate([state["sums"], values])
+        sigma = np.concatenate([state["sigma"], sigma])
+    unique_ep, groups = np.unique(epochs, return_inverse=True)
+    sums = np.zeros((unique_ep.shape[0], 7))
+    np.add.at(sums, groups.reshape(-1), values)
+    return {"epochs": unique_ep, "sums": sums, "sigma": np.unique(sigma)}
+
+
+def aggregate_state(state):
+    """Per epoch aggregates of the sums of accumulate_trace, in the layout of aggregate"""
+    sums = state["sums"]
+    count = sums[:, _COUNT]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_reward = sums[:, _REWARD] / count
+        std_reward = np.sqrt(np.maximum(sums[:, _REWARD_SQ] / count - mean_reward ** 2, 0))
+        mean_epist, std_epist, mean_aleat, std_aleat = [
+            sums[:, column] / count for column in (_MEAN_EPIST, _STD_EPIST, _MEAN_ALEAT, _STD_ALEAT)
+        ]
+    as32 = lambda array: array.astype(np.float32)
+    return {
+        "unique_ep": state["epochs"],
+        "mean_reward": as32(mean_reward),
+        "mean_epist": as32(mean_epist),
+        "mean_aleat": as32(mean_aleat),
+        "std_reward": as32(std_reward),
+        "std_epist": as32(std_epist),
+        "std_aleat": as32(std_aleat),
+        "sigma": state["sigma"],
+    }
+
+
+_cache = TraceCache(accumulate_trace, aggregate_state)
+
+
+def group_mean_std(values, groups, nb_groups):
+    """Mean and population std of values grouped by integer labels, NaN for empty groups"""
+    counts = np.bincount(groups, minlength=nb_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.bincount(groups, weights=values, minlength=nb_groups) / counts
+        var = np.bincount(groups, weights=(values - mean[groups]) ** 2, minlength=nb_groups) / counts
+    return mean, np.sqrt(var)
+
+
+def process(epochs, reward, epist, aleat, lengths=None):
+    """Aggregate evaluation episodes by training epoch
+
+    Args:
+        epochs (np.ndarray): Epoch of every episode
+        reward (np.ndarray): Score of every episode
+        epist (list): Per step epistemic uncertainty of every episode, or a flat array if lengths is given
+        aleat (list): Per step aleatoric uncertainty of every episode, or a flat array if lengths is given
+        lengths (np.ndarray, optional): Steps of every episode when epist and aleat are flat. Defaults to None.
+    """
+    epochs = np.asarray(epochs)
+    if lengths is None:
+        lengths = np.array([len(e) for e in epist], dtype=np.int64)
+        flat_epist = np.concatenate(epist) if len(epist) else np.zeros(0, dtype=np.float32)
+        flat_aleat = np.concatenate(aleat) if len(aleat) else np.zeros(0, dtype=np.float32)
+    else:
+        flat_epist, flat_aleat = epist, aleat
+        split = np.cumsum(lengths)[:-1]
+        epist, aleat = np.split(flat_epist, split), np.split(flat_aleat, split)
+    means, stds = aggregate(epochs, reward, flat_epist, flat_aleat, lengths)
+    return epochs, means, stds, (epist, aleat)
+
+
+def aggregate(epochs, reward, flat_epist, flat_aleat, lengths):
+    """Per epoch (unique_ep, mean_reward, mean_epist, mean_aleat), (std_reward, std_epist, std_aleat)"""
+    return aggregate_episodes(
+        epochs, reward, *episode_mean_std(flat_epist, lengths), *episode_mean_std(flat_aleat, lengths)
+    )
+
+
+def aggregate_episodes(epochs, reward, mean_epist, std_epist, mean_aleat, std_aleat):
+    """Per epoch aggregates from per episode statistics, each episode counting once whatever its length"""
+    unique_ep, groups = np.unique(epochs, return_inverse=True)
+    nb_groups = unique_ep.shape[0]
+    mean_reward, std_reward = group_mean_std(np.asarray(reward, dtype=np.float64), groups, nb_groups)
+
+    counts = np.bincount(groups, minlength=nb_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_epist, std_epist, mean_aleat, std_aleat = [
+            np.bincount(groups, weights=np.asarray(values, dtype=np.float64), minlength=nb_groups) / counts
+            for values in (mean_epist, std_epist, mean_aleat, std_aleat)
+        ]
+
+    as32 = lambda array: array.astype(np.float32)
+    return (
+        (unique_ep, as32(mean_reward), as32(mean_epist), as32(mean_aleat)),
+        (as32(std_reward), as32(std_epist), as32(std_aleat)),
+    )
+
+
+def process_curves(curves, smooth=None, multipliers=None):
+    """Smooth the rewards and scale the uncertainties of every model in one pass
+
+    Args:
+        curves (list): (mean_reward, mean_epist, mean_aleat) of every model
+        smooth (float, optional): Gaussian sigma. Defaults to None.
+        multipliers (list, optional): Uncertainty factor of every model. Defaults to None.
+
+    Returns:
+        tuple: Rewards, epistemic and aleatoric curves, epistemic and aleatoric magnitudes, one per model
+    """
+    nb_models = len(curves)
+    rewards = [curve[0] for curve in curves]
+    uncerts = [curve[1] for curve in curves] + [curve[2] for curve in curves]
+    if multipliers is not None:
+        multipliers = list(multipliers[:nb_models]) * 2
+    rewards, _ = prepare_curves(rewards, smooth=smooth, scale=False)
+    uncerts, magnitudes = prepare_curves(uncerts, smooth=smooth, multipliers=multipliers)
+    return rewards, uncerts[:nb_models], uncerts[nb_models:], magnitudes[:nb_models], magnitudes[nb_models:]
+
+
 def plot_uncert_train(
     paths,
     names,
@@ -70,6 +210,8 @@ def plot_uncert_train(
     plot_variance=False,
     multipliers=None,
 ):
+    import matplotlib.pyplot as plt
+
     assert len(paths) == len(names)
     if colors is not None:
         assert len(colors) > len(paths)
@@ -89,26 +231,19 @@ def plot_uncert_train(
     # ax[2].set_ylabel("Aleatoric Uncertainty", fontsize=16)
     ax[1].set_xlabel("Episode", fontsize=16)
     
-    for idx, (path, name, multiplier) in enumerate(zip(paths, names, multipliers)):
+    summaries = [read_uncert_summary(path)[0] for path in paths]
+    curves = process_curves([summary[1][1:] for summary in summaries], smooth, multipliers)
+
+    for idx, (name, summary) in enumerate(zip(names, summaries)):
         color = colors[idx] if colors is not None else None
         linewidth = linewidths[idx] if linewidths is not None else None
         (
             _,
-            (unique_ep, mean_reward, mean_epist, mean_aleat),
+            (unique_ep, _, _, _),
             (std_reward, std_epist, std_aleat),
             _,
-        ) = read_uncert(path)[0]
-
-        mean_epist = np.nan_to_num(mean_epist, nan=_NAN_)
-        mean_aleat = np.nan_to_num(mean_aleat, nan=_NAN_)
-
-        if smooth is not None:
-            mean_reward = gaussian_filter1d(mean_reward, smooth)
-            mean_epist[mean_epist != _NAN_] = gaussian_filter1d(mean_epist[mean_epist != _NAN_], smooth)
-            mean_aleat[mean_aleat != _NAN_] = gaussian_filter1d(mean_aleat[mean_aleat != _NAN_], smooth)
-
-        mean_epist[mean_epist != _NAN_], magnitude_epist = scale01(mean_epist[mean_epist != _NAN_]*multiplier)
-        mean_aleat[mean_aleat != _NAN_], magnitude_aleat = scale01(mean_aleat[mean_aleat != _NAN_]*multiplier)
+        ) = summary
+        mean_reward, mean_epist, mean_aleat, magnitude_epist, magnitude_aleat = (c[idx] for c in curves)
 
         # Plot uncertainties
         ax[1].plot(
@@ -143,6 +278,9 @@ def plot_uncert_train(
 def plotly_train(
     paths, names, colors=None, save_fig="images/uncertainties_train.html", smooth=None, plot_variance=False
 ):
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
     fig = make_subplots(
         rows=2,
         cols=2,
@@ -151,25 +289,18 @@ def plotly_train(
         # subplot_titles=("Epistemic uncertainty","Aleatoric uncertainty", "Rewards"),
     )
 
-    for idx, (path, name) in enumerate(zip(paths, names)):
+    summaries = [read_uncert_summary(path)[0] for path in paths]
+    curves = process_curves([summary[1][1:] for summary in summaries], smooth)
+
+    for idx, (name, summary) in enumerate(zip(names, summaries)):
         color = colors[idx] if colors is not None else None
         (
             _,
-            (unique_ep, mean_reward, mean_epist, mean_aleat),
+            (unique_ep, _, _, _),
             (std_reward, std_epist, std_aleat),
             _,
-        ) = read_uncert(path)[0]
-
-        mean_epist = np.nan_to_num(mean_epist, nan=_NAN_)
-        mean_aleat = np.nan_to_num(mean_aleat, nan=_NAN_)
-
-        if smooth is not None:
-            mean_reward = gaussian_filter1d(mean_reward, smooth)
-            mean_epist[mean_epist != _NAN_] = gaussian_filter1d(mean_epist[mean_epist != _NAN_], smooth)
-            mean_aleat[mean_aleat != _NAN_] = gaussian_filter1d(mean_aleat[mean_aleat != _NAN_], smooth)
-
-        mean_epist[mean_epist != _NAN_], magnitude_epist = scale01(mean_epist[mean_epist != _NAN_])
-        mean_aleat[mean_aleat != _NAN_], magnitude_aleat = scale01(mean_aleat[mean_aleat != _NAN_])
+        ) = summary
+        mean_reward, mean_epist, mean_aleat, magnitude_epist, magnitude_aleat = (c[idx] for c in curves)
 
         rwd_upper, rwd_lower = mean_reward + std_reward, (mean_reward - std_reward)
 
@@ -256,6 +387,8 @@ def plot_uncert_test(
     plot_variance=False,
     multipliers=None
 ):
+    import matplotlib.pyplot as plt
+
     assert len(paths) == len(names)
     if colors is not None:
         assert len(colors) > len(paths)
@@ -276,31 +409,22 @@ def plot_uncert_test(
     ax[1].set_xlabel("Noise Variance", fontsize=16)
     
 
-    for idx, (path, name, multiplier) in enumerate(zip(paths, names, multipliers)):
+    summaries = [read_uncert_summary(path) for path in paths]
+    curves = process_curves([summary[0][1][1:] for summary in summaries], smooth, multipliers)
+
+    for idx, (name, summary) in enumerate(zip(names, summaries)):
         color = colors[idx] if colors is not None else None
         linewidth = linewidths[idx] if linewidths is not None else None
         (
             (
                 _,
-                (_, mean_reward, mean_epist, mean_aleat),
+                _,
                 (std_reward, std_epist, std_aleat),
                 _,
             ),
             sigma,
-        ) = read_uncert(path)
-
-        mean_epist = np.nan_to_num(mean_epist, nan=_NAN_)
-        mean_aleat = np.nan_to_num(mean_aleat, nan=_NAN_)
-
-        if smooth is not None:
-            mean_reward = gaussian_filter1d(mean_reward, smooth)
-            mean_epist[mean_epist != _NAN_] = gaussian_filter1d(mean_epist[mean_epist != _NAN_], smooth)
-            mean_aleat[mean_aleat != _NAN_] = gaussian_filter1d(mean_aleat[mean_aleat != _NAN_], smooth)
-
-        # if 'mix' in name.lower():
-        #    mean_epist = 1 - np.exp(mean_epist)
-        mean_epist[mean_epist != _NAN_], magnitude_epist = scale01(mean_epist[mean_epist != _NAN_]*multiplier)
-        mean_aleat[mean_aleat != _NAN_], magnitude_aleat = scale01(mean_aleat[mean_aleat != _NAN_]*multiplier)
+        ) = summary
+        mean_reward, mean_epist, mean_aleat, magnitude_epist, magnitude_aleat = (c[idx] for c in curves)
 
         # Plot uncertainties
         # ax[1].plot(
@@ -335,6 +459,9 @@ def plot_uncert_test(
 def plotly_test(
     paths, names, colors=None, save_fig="images/uncertainties_test.html", smooth=None, plot_variance=False
 ):
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
     fig = make_subplots(
         rows=2,
         cols=2,
@@ -343,28 +470,21 @@ def plotly_test(
         # subplot_titles=("Epistemic uncertainty","Aleatoric uncertainty", "Rewards"),
     )
 
-    for idx, (path, name) in enumerate(zip(paths, names)):
+    summaries = [read_uncert_summary(path) for path in paths]
+    curves = process_curves([summary[0][1][1:] for summary in summaries], smooth)
+
+    for idx, (name, summary) in enumerate(zip(names, summaries)):
         color = colors[idx] if colors is not None else None
         (
             (
                 _,
-                (_, mean_reward, mean_epist, mean_aleat),
+                _,
                 (std_reward, std_epist, std_aleat),
                 _,
             ),
             sigma,
-        ) = read_uncert(path)
-
-        mean_epist = np.nan_to_num(mean_epist, nan=_NAN_)
-        mean_aleat = np.nan_to_num(mean_aleat, nan=_NAN_)
-
-        if smooth is not None:
-            mean_reward = gaussian_filter1d(mean_reward, smooth)
-            mean_epist[mean_epist != _NAN_] = gaussian_filter1d(mean_epist[mean_epist != _NAN_], smooth)
-            mean_aleat[mean_aleat != _NAN_] = gaussian_filter1d(mean_aleat[mean_aleat != _NAN_], smooth)
-
-        mean_epist[mean_epist != _NAN_], magnitude_epist = scale01(mean_epist[mean_epist != _NAN_])
-        mean_aleat[mean_aleat != _NAN_], magnitude_aleat = scale01(mean_aleat[mean_aleat != _NAN_])
+        ) = summary
+        mean_reward, mean_epist, mean_aleat, magnitude_epist, magnitude_aleat = (c[idx] for c in curves)
 
         rwd_upper, rwd_lower = mean_reward + std_reward, (mean_reward - std_reward)
 
@@ -443,6 +563,8 @@ def plotly_test(
     fig.write_html(save_fig)
 
 def plot_uncert_comparative(train_paths, test_paths, names, linewidths=None, smooth=None, imgs_path='images/', log_scales=[]):
+    import matplotlib.pyplot as plt
+
     assert len(train_paths) == len(names)
     assert len(test_paths) == len(names)
     if linewidths is not None:
@@ -457,7 +579,7 @@ def plot_uncert_comparative(train_paths, test_paths, names, linewidths=None, smo
             (unique_ep, _, mean_epist, mean_aleat),
             (_, std_epist, std_aleat),
             _,
-        ) = read_uncert(train_path)[0]
+        ) = read_uncert_summary(train_path)[0]
 
         ncols = 0
         plot_epist = False
@@ -528,7 +650,7 @@ def plot_uncert_comparative(train_paths, test_paths, names, linewidths=None, smo
                 _,
             ),
             sigma,
-        ) = read_uncert(test_path)
+        ) = read_uncert_summary(test_path)
 
         if ncols == 2:
             lns3 = ax2.plot(
@@ -573,6 +695,8 @@ def plot_uncert_comparative(train_paths, test_paths, names, linewidths=None, smo
         fig.savefig(f"{imgs_path}{file_name}")
 
 def plot_comparative(train_paths, test0_paths, test_paths, names, linewidths=None, imgs_path='images/'):
+    import matplotlib.pyplot as plt
+
     assert len(train_paths) == len(names)
     assert len(test_paths) == len(names)
     assert len(test0_paths) == len(names)
@@ -599,7 +723,7 @@ def plot_comparative(train_paths, test0_paths, test_paths, names, linewidths=Non
             (unique_ep, _, mean_epist, _),
             (_, std_epist, std_aleat),
             _,
-        ) = read_uncert(train_path)[0]
+        ) = read_uncert_summary(train_path)[0]
         mean_epist = np.nan_to_num(mean_epist, nan=_NAN_)
         ax[0].plot(
             unique_ep, mean_epist, linewidth=linewidth
@@ -611,8 +735,7 @@ def plot_comparative(train_paths, test0_paths, test_paths, names, linewidths=Non
             (unique_ep, mean_reward, mean_epist, mean_aleat),
             (std_reward, std_epist, std_aleat),
             (epist, aleat),
-        ) = read_uncert(test0_path)[0]
-        epist = [np.mean(e) for e in epist]
+        ) = read_uncert_summary(test0_path)[0]
         ax[1].plot(
             epist, linewidth=linewidth
         )
@@ -625,7 +748,7 @@ def plot_comparative(train_paths, test0_paths, test_paths, names, linewidths=Non
                 _,
             ),
             sigma,
-        ) = read_uncert(test_path)
+        ) = read_uncert_summary(test_path)
         ax[2].plot(
             sigma, mean_epist, linewidth=linewidth
         )
@@ -1,5 +1,9 @@
 import numpy as np
 import argparse
+import random
+import torch
+
+from shared.utils.trace import append_episode, init_trace
 
 def str2bool(v):
     if isinstance(v, bool):
@@ -11,13 +15,25 @@ def str2bool(v):
     else:
         raise argparse.ArgumentTypeError('Boolean value expected.')
 
-def save_uncert(epoch, val_episode, score, uncert, file='uncertainties/train.txt', sigma=None):
-    with open(file, 'a+') as f:
-        if sigma is None:
-            np.savetxt(f, np.concatenate(([epoch], [val_episode], [score], uncert.T.reshape(-1))).reshape(1, -1), delimiter=',')
-        else:
-            np.savetxt(f, np.concatenate(([epoch], [val_episode], [score], [sigma], uncert.T.reshape(-1))).reshape(1, -1), delimiter=',')
+def save_uncert(epoch, val_episode, score, uncert, file='uncertainties/train.trace', sigma=None):
+    append_episode(file, epoch, val_episode, score, uncert, sigma=sigma)
+
+def init_uncert_file(file='uncertainties/train.trace'):
+    init_trace(file)
+
+def get_rng_state():
+    state = {
+        "random": random.getstate(),
+        "numpy": np.random.get_state(),
+        "torch": torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
 
-def init_uncert_file(file='uncertainties/train.txt'):
-    with open(file, 'w+') as f:
-        pass
+def set_rng_state(state):
+    random.setstate(state["random"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import numpy as np
+
+SRC_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (working directory, command line) of the entry points
+COMMANDS = [
+    ("ppo", ["run.py", "--help"]),
+    ("ppo", ["train.py", "--help"]),
+    ("dqn", ["train.py", "--help"]),
+    ("ppo", ["plot_uncertainties.py", "--help"]),
+]
+
+
+def time_command(cwd, argv, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable] + argv, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True
+        )
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def slowest_imports(cwd, argv, top):
+    """Top level modules sorted by cumulative import time, from python -X importtime"""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime"] + argv, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+    modules = []
+    for row in process.stderr.splitlines():
+        fields = row.split("|")
+        if len(fields) == 3 and fields[2].startswith(" ") and not fields[2].startswith("  "):
+            try:
+                modules.append((int(fields[1]), fields[2].strip()))
+            except ValueError:
+                continue
+    return sorted(modules, reverse=True)[:top]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure the startup time of the command line entry points",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "-R", "--repeats", type=int, default=5, help="Runs of each command"
+    )
+    parser.add_argument(
+        "-T", "--top", type=int, default=0, help="Also print the N slowest top level imports of each command"
+    )
+    parser.add_argument(
+        "-O", "--output", type=str, default=None, help="Append the results to this jsonl file"
+    )
+    args = parser.parse_args()
+
+    results = {}
+    for folder, argv in COMMANDS:
+        cwd = os.path.join(SRC_PATH, folder)
+        name = f"{folder}/{' '.join(argv)}"
+        times = time_command(cwd, argv, args.repeats)
+        results[name] = {"median": float(np.median(times)), "min": float(np.min(times))}
+        print(f"{name:40s} median {np.median(times):.3f}s  min {np.min(times):.3f}s")
+        for cumulative, module in slowest_imports(cwd, argv, args.top) if args.top else []:
+            print(f"    {module:36s} {cumulative / 1e6:.3f}s")
+
+    if args.output:
+        with open(args.output, "a+") as f:
+            f.write(json.dumps({"time": time.time(), "results": results}) + "\n")
@@ -0,0 +1,89 @@
+import os
+import sys
+from collections import namedtuple
+
+import numpy as np
+import torch
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from shared.utils.replay_buffer import ReplayMemory, NStepMemory
+
+Transition = namedtuple('Transition', ('state', 'action', 'next_state', 'reward', 'done', 'discount'))
+
+
+def push_episodes(buffer, episodes, flush=True):
+    """Push (rewards, terminal) episodes, state t of episode e is e * 10000 + t"""
+    for e, (rewards, terminal) in enumerate(episodes):
+        for t, reward in enumerate(rewards):
+            done = terminal and t == len(rewards) - 1
+            buffer.push(
+                torch.Tensor([[e * 10000 + t]]),
+                torch.tensor([[t]]),
+                torch.Tensor([[e * 10000 + t + 1]]),
+                torch.Tensor([reward]),
+                torch.Tensor([done]),
+            )
+        if flush:
+            buffer.end_episode()
+
+
+def brute_force(episodes, n_steps, gamma):
+    """Expected (state, next_state, return, discount, done) of every n-step transition"""
+    expected = []
+    for e, (rewards, terminal) in enumerate(episodes):
+        length = len(rewards)
+        for t in range(length):
+            end = min(t + n_steps, length)
+            n_return = sum(gamma ** (j - t) * float(rewards[j]) for j in range(t, end))
+            done = float(terminal and end == length)
+            expected.append((e * 10000 + t, e * 10000 + end, n_return, gamma ** (end - t), done))
+    return expected
+
+
+def check(buffer, expected):
+    stored = list(buffer.memory)
+    assert len(stored) == len(expected)
+    for transition, (state, next_state, n_return, discount, done) in zip(stored, expected):
+        assert transition.state.item() == state
+        assert transition.next_state.item() == next_state
+        assert np.isclose(transition.reward.item(), n_return, rtol=1e-5, atol=1e-5)
+        assert np.isclose(transition.discount.item(), discount, rtol=1e-6)
+        assert transition.done.item() == done
+
+
+def test_returns_and_discounts():
+    rng = np.random.default_rng(0)
+    # Terminal and truncated episodes, shorter and longer than the n steps
+    episodes = [(rng.normal(size=length), terminal) for length, terminal in
+                [(7, True), (2, True), (5, False), (1, False), (3, True), (1, True)]]
+    for n_steps in [1, 3, 5]:
+        for gamma in [0.99, 0.5, 0.0]:
+            buffer = NStepMemory(ReplayMemory(1000, 4, Transition), n_steps, gamma)
+            push_episodes(buffer, episodes)
+            check(buffer, brute_force(episodes, n_steps, gamma))
+
+
+def test_pending_until_flush():
+    buffer = NStepMemory(ReplayMemory(1000, 4, Transition), 3, 0.9)
+    episodes = [(np.ones(5), False)]
+    push_episodes(buffer, episodes, flush=False)
+    # The last n - 1 transitions wait for their next steps
+    assert len(buffer) == 3
+    buffer.end_episode()
+    check(buffer, brute_force(episodes, 3, 0.9))
+
+
+def test_long_episode_stays_exact():
+    rng = np.random.default_rng(1)
+    episodes = [(rng.normal(size=1000), True)]
+    for gamma in [0.9, 0.8]:
+        buffer = NStepMemory(ReplayMemory(1000, 4, Transition), 3, gamma)
+        push_episodes(buffer, episodes)
+        check(buffer, brute_force(episodes, 3, gamma))
+
+
+if __name__ == "__main__":
+    test_returns_and_discounts()
+    test_pending_until_flush()
+    test_long_episode_stays_exact()
+    print("ok")